@@ -11,11 +11,13 @@ from Urcheon import Default
 from Urcheon import FileSystem
 from Urcheon import IqmConfig
 from Urcheon import MapCompiler
+from Urcheon import Pixmap
 from Urcheon import Repository
 from Urcheon import Texset
 from Urcheon import Ui
 from Urcheon import Pak
 from Urcheon import Bsp
+import io
 import logging
 import os
 import re
@@ -24,7 +26,6 @@ import subprocess
 import sys
 import tempfile
 from collections import OrderedDict
-from PIL import Image
 
 
 # TODO: replace with / os.path.sep when reading then replace os.path.sep to / when writing
@@ -61,7 +62,7 @@ class List():
 
 	def readActions(self, action_list=None):
 		if not action_list:
-			if os.path.isfile(self.action_list_path):
+			if FileSystem.isFile(self.action_list_path):
 				action_list_file = open(self.action_list_path, "r")
 				line_list = [line.strip() for line in action_list_file]
 				action_list_file.close()
@@ -108,8 +109,8 @@ class List():
 				action_name = action_dict["action_name"]
 				file_path = action_dict["file_path"]
 
-				file_fullpath = os.path.realpath(os.path.join(self.source_dir, file_path))
-				if os.path.isfile(file_fullpath):
+				file_fullpath = FileSystem.getRealPath(os.path.join(self.source_dir, file_path))
+				if FileSystem.isFile(file_fullpath):
 					Ui.print(file_path + ": Known rule, will " + self.inspector.action_description_dict[action_name] + " (predefined action).")
 					self.active_action_dict[action_name].append(file_path)
 				else:
@@ -225,7 +226,7 @@ class Action():
 
 	cwebp_base_command = ["cwebp", "-v", "-mt", "-exact", "-alpha_q", "100"]
 
-	def __init__(self, source_tree, build_dir, file_path, stage_name, map_profile=None, action_list=None, thread_count=1, is_parallel=True, is_nested=False):
+	def __init__(self, source_tree, build_dir, file_path, stage_name, map_profile=None, action_list=None, thread_count=1, is_parallel=True, is_nested=False, webp_encoder="cwebp", image_cache=None):
 		self.body = []
 		self.source_tree = source_tree
 		self.source_dir = source_tree.dir
@@ -238,6 +239,8 @@ class Action():
 		self.thread_count = thread_count
 		self.is_parallel = is_parallel
 		self.is_nested = is_nested
+		self.webp_encoder = webp_encoder
+		self.image_cache = image_cache
 		self.paktrace = Repository.Paktrace(self.source_tree, self.build_dir)
 
 	def isDone(self):
@@ -247,12 +250,23 @@ class Action():
 		else:
 			return False
 
+	def decodesImage(self):
+		# Tells if running the action decodes the source image,
+		# symbolic links are not converted.
+		if FileSystem.isLink(self.getSourcePath()):
+			return False
+
+		return self.isImageConversion()
+
+	def isImageConversion(self):
+		return False
+
 	# TODO: Maybe tell developer when nothing is done because he
 	# has to call both run() and symlink() to handle all the uses cases.
 	def run(self):
 		full_path = os.path.join(self.source_dir, self.file_path)
 
-		if os.path.islink(full_path):
+		if FileSystem.isLink(full_path):
 			return []
 		else:
 			return self.effective_run()
@@ -267,7 +281,7 @@ class Action():
 		if self.stage_name == "prepare":
 			return []
 
-		if os.path.islink(full_path):
+		if FileSystem.isLink(full_path):
 			return self.effective_symlink()
 		else:
 			return []
@@ -281,20 +295,20 @@ class Action():
 			Ui.error("Doing symbolic links with Action class requires to pass action_list on initialization")
 
 		full_path = os.path.join(self.source_dir, self.file_path)
-		real_path = os.path.realpath(full_path)
+		real_path = FileSystem.getRealPath(full_path)
 
 		found_target = False
 		for action_type in list():
 			for target_file_path in self.action_list.active_action_dict[action_type.keyword]:
 				target_full_path = os.path.join(self.source_dir, target_file_path)
 
-				if os.path.islink(target_full_path):
+				if FileSystem.isLink(target_full_path):
 					continue
 
 				if self.file_path == target_file_path:
 					continue
 
-				target_real_path = os.path.realpath(target_full_path)
+				target_real_path = FileSystem.getRealPath(target_full_path)
 
 				if real_path == target_real_path:
 					found_target = True
@@ -365,6 +379,10 @@ class Action():
 
 		body = self.getBody(head)
 
+		# Produced files may have been written, removed or replaced.
+		for produced_file in body:
+			FileSystem.invalidate(os.path.join(self.build_dir, produced_file))
+
 		# If action is not ignore nor delete,
 		# always write paktrace, even if head is the only body part because
 		# the prepare stage clean-up needs to track all produced files
@@ -401,7 +419,7 @@ class Action():
 		return os.path.splitext(self.file_path)[1][len(os.path.extsep):].lower()
 
 	def isDifferent(self):
-		if not os.path.isfile(self.getTargetPath()):
+		if not FileSystem.isFile(self.getTargetPath()):
 			return True
 
 		# Always consider files from nested build to be different
@@ -433,7 +451,9 @@ class Action():
 					logging.debug("setting stat from “" + reference_path + "”: " + produced_path)
 					shutil.copystat(reference_path, produced_path)
 
-	def callProcess(self, command_list):
+	def callProcess(self, command_list, input_data=None, capture_output=False):
+		# Input data is written to the standard input,
+		# the standard output is returned if captured.
 		if Ui.verbosity == "verbose":
 			subprocess_stdout = None
 			subprocess_stderr = None
@@ -441,9 +461,16 @@ class Action():
 			subprocess_stdout = subprocess.DEVNULL
 			subprocess_stderr = subprocess.DEVNULL
 
-		if subprocess.call(command_list, stdout=subprocess_stdout, stderr=subprocess_stderr) != 0:
+		if capture_output:
+			subprocess_stdout = subprocess.PIPE
+
+		completed_process = subprocess.run(command_list, input=input_data, stdout=subprocess_stdout, stderr=subprocess_stderr)
+
+		if completed_process.returncode != 0:
 			Ui.error("command failed: '" + "' '".join(command_list) + "'")
 
+		return completed_process.stdout
+
 	def getSourceList(self):
 		return [ self.file_path ]
 
@@ -457,37 +484,44 @@ class Action():
 
 	# Produce an image that is properly writable.
 	def openAndSanitizeImage(self):
+		# Only import Pillow when converting images, importing it is slow.
+		from PIL import Image
 
 		# HACK: Pillow has a bug and converts 8-bit greyscale PNG to 1-bit black and white image when converting to RGB,
-		# We workaround the issue by converting PNG images to lossless WebP first, to get an RGB WebP
+		# We workaround the issue by converting such PNG images to lossless WebP first, to get an RGB WebP
 		# that will be properly loaded and converted to other RGB formats by Pillow.
+		# The WebP image is read from the cwebp output without writing it to disk,
+		# other PNG images are loaded directly.
 
 		source_path = self.getSourcePath()
 
-		if source_path[-4:].lower() == ".png":
-			build_path = self.getTargetPath()
+		# Sources converted more than once are decoded once.
+		if self.image_cache != None:
+			image = self.image_cache.get(source_path)
 
-			transient_handle, transient_path = tempfile.mkstemp(suffix="_" + os.path.basename(build_path) + "_transient" + os.path.extsep + "webp")
-			os.close(transient_handle)
+			if image != None:
+				logging.debug("using decoded image from cache: " + source_path)
+				return image
 
-			self.callProcess(self.cwebp_base_command + ["-lossless", "-z", "0", source_path, "-o", transient_path])
+		image = Image.open(source_path)
 
-			image = Image.open(transient_path)
+		if image.format == "PNG" and not Pixmap.isSanePngMode(image):
+			image.close()
 
-			os.remove(transient_path)
-		else:
-			image = Image.open(source_path)
+			webp_data = self.callProcess(self.cwebp_base_command + ["-lossless", "-z", "0", source_path, "-o", "-"], capture_output=True)
+
+			image = Image.open(io.BytesIO(webp_data))
 
 		image = image.convert("RGBA")
 
-		# If there is a single pixel that isn't fully opaque, return the RGBA image.
-		for x in range(0, image.width):
-			for y in range(0, image.height):
-				if image.getpixel((x, y))[3] != 255:
-					return image
+		# If there is a single pixel that isn't fully opaque, return the RGBA image,
+		# otherwise strips the alpha channel and return the RGB image.
+		image = Pixmap.stripOpaqueAlpha(image)
+
+		if self.image_cache != None:
+			self.image_cache.set(source_path, image)
 
-		# Otherwise strips the alpha channel and return the RGB image.
-		return image.convert("RGB")
+		return image
 
 
 # TODO: Catch when it is not supported and print a warning.
@@ -563,7 +597,7 @@ class ConvertJpg(Action):
 		build_path = self.getTargetPath()
 		self.createSubdirs()
 
-		if self.getExt() in ("jpg", "jpeg"):
+		if not self.isImageConversion():
 			Ui.laconic("File already in jpg, copy: " + self.file_path)
 			shutil.copyfile(source_path, build_path)
 		else:
@@ -579,6 +613,9 @@ class ConvertJpg(Action):
 
 		return self.getProducedUnitList()
 
+	def isImageConversion(self):
+		return self.getExt() not in ("jpg", "jpeg")
+
 	def getFileNewName(self):
 		return self.switchExtension("jpg")
 
@@ -600,7 +637,7 @@ class ConvertPng(Action):
 		build_path = self.getTargetPath()
 		self.createSubdirs()
 
-		if self.getExt() == "png":
+		if not self.isImageConversion():
 			Ui.laconic("File already in png, copy: " + self.file_path)
 			shutil.copyfile(source_path, build_path)
 		else:
@@ -612,6 +649,9 @@ class ConvertPng(Action):
 
 		return self.getProducedUnitList()
 
+	def isImageConversion(self):
+		return self.getExt() != "png"
+
 	def getFileNewName(self):
 		return self.switchExtension("png")
 
@@ -625,20 +665,23 @@ class ConvertLosslessWebp(Action):
 	output_format_is_lossless = True
 	cwebp_extra_args = ["-lossless", "-z", "9"]
 
-	def detect_lossless_webp(self, source_path):
-		subprocess_stdout = subprocess.PIPE
-		subprocess_stderr = subprocess.DEVNULL
-
-		command_list = ["webpinfo", source_path]
-
-		proc = subprocess.Popen(command_list, stdout=subprocess_stdout, stderr=subprocess_stderr)
+	# Same options as cwebp ones when using Pillow, None if
+	# Pillow has no equivalent for some of them.
+	pillow_webp_args = {
+		"lossless": True,
+		"quality": 100,
+		"method": 6,
+		"exact": True,
+		"alpha_quality": 100,
+	}
 
-		stdout, stderr = proc.communicate()
+	def detect_lossless_webp(self, source_path):
+		is_lossless = Pixmap.isLosslessWebp(source_path)
 
-		if proc.returncode != 0:
-			Ui.error("command failed: '" + "' '".join(command_list) + "'")
+		if is_lossless == None:
+			Ui.error("unknown webp format: " + source_path)
 
-		return b"Format: Lossless (2)" in stdout
+		return is_lossless
 
 
 	def effective_run(self):
@@ -676,21 +719,35 @@ class ConvertLosslessWebp(Action):
 
 			image = self.openAndSanitizeImage()
 
-			# cwebp doesn't support many input format, PNG is known to be well supported,
-			# so we convert the image to PNG first.
-			transient_handle, transient_path = tempfile.mkstemp(suffix="_" + os.path.basename(build_path) + "_transient" + os.path.extsep + "png")
-			os.close(transient_handle)
+			if self.webp_encoder == "pillow" and self.pillow_webp_args != None:
+				# Only import Pillow when converting images, importing it is slow.
+				from PIL import features
 
-			image.save(transient_path)
+				if not features.check("webp"):
+					Ui.error("Pillow is built without webp support")
 
-			self.callProcess(self.cwebp_base_command + self.cwebp_extra_args + [transient_path, "-o", build_path])
+				image.save(build_path, format="WEBP", **self.pillow_webp_args)
+			else:
+				# cwebp doesn't support many input format, PNG is known to be well supported,
+				# so we convert the image to PNG first, given to cwebp through its standard
+				# input. The PNG is not compressed since it is only read once.
+				png_buffer = io.BytesIO()
+				image.save(png_buffer, format="PNG", compress_level=0)
 
-			os.remove(transient_path)
+				self.callProcess(self.cwebp_base_command + self.cwebp_extra_args + ["-o", build_path, "--", "-"], input_data=png_buffer.getvalue())
 
 		self.setTimeStamp()
 
 		return self.getProducedUnitList()
 
+	def isImageConversion(self):
+		# Only lossless WebP are converted to lossy WebP,
+		# other WebP images are copied.
+		if self.getExt() != "webp":
+			return True
+
+		return not self.output_format_is_lossless and Pixmap.isLosslessWebp(self.getSourcePath()) == True
+
 	def getFileNewName(self):
 		return self.switchExtension("webp")
 
@@ -706,6 +763,9 @@ class ConvertLossyWebp(ConvertLosslessWebp):
 	output_format_is_lossless = False
 	cwebp_extra_args = ["-sharp_yuv", "-m", "6", "-q", "95", "-pass", "10"]
 
+	# Pillow can't set sharp YUV conversion nor the pass count.
+	pillow_webp_args = None
+
 
 class ConvertCrn(Action):
 	threaded = True
@@ -723,7 +783,7 @@ class ConvertCrn(Action):
 		build_path = self.getTargetPath()
 		self.createSubdirs()
 
-		if self.getExt() == self.file_ext:
+		if not self.isImageConversion():
 			Ui.laconic("File already in crn, copy: " + self.file_path)
 			shutil.copyfile(source_path, build_path)
 		else:
@@ -743,7 +803,9 @@ class ConvertCrn(Action):
 
 			image = self.openAndSanitizeImage()
 
-			transient_handle, transient_path = tempfile.mkstemp(suffix="_" + os.path.basename(build_path) + "_transient" + os.path.extsep + "tga")
+			# The crunch tool can only read files, the TGA file is written
+			# to shared memory when available.
+			transient_handle, transient_path = tempfile.mkstemp(suffix="_" + os.path.basename(build_path) + "_transient" + os.path.extsep + "tga", dir=FileSystem.getTransientDir())
 			os.close(transient_handle)
 
 			image.save(transient_path)
@@ -756,6 +818,9 @@ class ConvertCrn(Action):
 
 		return self.getProducedUnitList()
 
+	def isImageConversion(self):
+		return self.getExt() != self.file_ext
+
 	def getFileNewName(self):
 		return self.switchExtension(self.file_ext)
 
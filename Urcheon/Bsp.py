@@ -19,7 +19,6 @@ import struct
 import sys
 from collections import OrderedDict
 from logging import debug
-from PIL import Image
 
 class Lump():
 	bsp_parser_dict = None
@@ -296,6 +295,8 @@ class Q3Lightmaps(Lump):
 		file_list = sorted(glob.glob(dir_name + os.path.sep + "lm_*" + os.path.extsep + "*"))
 		for file_name in file_list:
 			debug("loading lightmap: " + file_name)
+			# Only import Pillow when needed, importing it is slow.
+			from PIL import Image
 			image = Image.open(file_name)
 			lightmap = image.convert(self.lightmap_colorspace).tobytes()
 
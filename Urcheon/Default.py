@@ -20,10 +20,24 @@ repository_config_dir = ".urcheon"
 
 cache_dir = ".cache"
 
+user_cache_dir = "urcheon"
+profile_cache_dir = "profile"
+profile_cache_ext = ".json"
+version_cache_dir = "version"
+version_cache_ext = ".json"
+
 legacy_paktrace_dir = ".paktrace"
 paktrace_dir = os.path.join(cache_dir, "urcheon", "paktrace")
 paktrace_file_ext = ".json"
 
+deflate_dir = os.path.join(cache_dir, "urcheon", "deflate")
+deflate_file_ext = ".deflate"
+deflate_meta_ext = ".json"
+
+# Memory used to keep decoded images of sources converted more than once,
+# in mebibytes.
+image_cache_size = 512
+
 default_base = "common"
 
 game_profile_dir = "game"
@@ -96,6 +110,21 @@ def getPakConfigDir(source_dir):
 
 	return config_dir
 
+def getUserCacheDir():
+	env_cache_home = os.getenv("XDG_CACHE_HOME")
+
+	if env_cache_home:
+		cache_home = env_cache_home
+	elif os.name == "nt" and os.getenv("LOCALAPPDATA"):
+		cache_home = os.getenv("LOCALAPPDATA")
+	else:
+		cache_home = os.path.join(os.path.expanduser("~"), cache_dir)
+
+	return os.path.abspath(os.path.join(cache_home, user_cache_dir))
+
+def getDeflateDir(build_dir):
+	return os.path.abspath(os.path.join(build_dir, deflate_dir))
+
 def getPakTraceDir(build_dir):
 	cache_dir = os.path.abspath(os.path.join(build_dir, paktrace_dir))
 	legacy_cache_dir = os.path.abspath(os.path.join(build_dir, legacy_paktrace_dir))
@@ -11,10 +11,13 @@
 from Urcheon import Ui
 import logging
 import os
+import stat
+import threading
 
 
 def cleanRemoveFile(file_name):
 	os.remove(file_name)
+	invalidate(file_name)
 	dir_name = os.path.dirname(file_name)
 	removeEmptyDir(dir_name)
 
@@ -23,6 +26,7 @@ def removeEmptyDir(dir_name):
 	if os.path.isdir(dir_name):
 		if os.listdir(dir_name) == []:
 			os.rmdir(dir_name)
+			invalidate(dir_name)
 
 
 def makeFileSubdirs(file_name):
@@ -59,3 +63,215 @@ def isSameTimestamp(file_path, reference_path):
 
 def isDifferentTimestamp(file_path, reference_path):
 	return not isSame(file_path, reference_path)
+
+def getTransientDir():
+	# Transient files are written to shared memory when
+	# available, None means the default temporary directory.
+	transient_dir = "/dev/shm"
+
+	if os.path.isdir(transient_dir) and os.access(transient_dir, os.W_OK):
+		return transient_dir
+
+	return None
+
+
+# Snapshot of the file system, directories are listed once with scandir
+# and stat results are kept in memory for the whole run, actions writing
+# or removing files must call invalidate() on the paths they touch.
+
+class SnapshotEntry():
+	def __init__(self, file_path, dir_entry=None):
+		self.path = file_path
+		self.dir_entry = dir_entry
+		self.lstat_result = None
+		self.stat_result = None
+		self.is_stat_done = False
+
+	def isLink(self):
+		if self.dir_entry:
+			return self.dir_entry.is_symlink()
+
+		return stat.S_ISLNK(self.getLStat().st_mode)
+
+	def getLStat(self):
+		if self.lstat_result == None:
+			if self.dir_entry:
+				self.lstat_result = self.dir_entry.stat(follow_symlinks=False)
+			else:
+				self.lstat_result = os.lstat(self.path)
+
+		return self.lstat_result
+
+	def getStat(self):
+		# None for broken symbolic links.
+		if not self.is_stat_done:
+			try:
+				if self.dir_entry:
+					self.stat_result = self.dir_entry.stat()
+				else:
+					self.stat_result = os.stat(self.path)
+			except OSError:
+				self.stat_result = None
+
+			self.is_stat_done = True
+
+		return self.stat_result
+
+
+class Snapshot():
+	def __init__(self):
+		self.dir_dict = {}
+		self.realpath_dict = {}
+		self.lock = threading.RLock()
+
+	def scanDir(self, dir_path):
+		entry_dict = {}
+
+		try:
+			with os.scandir(dir_path) as dir_iterator:
+				for dir_entry in dir_iterator:
+					entry_dict[dir_entry.name] = SnapshotEntry(dir_entry.path, dir_entry=dir_entry)
+		except (FileNotFoundError, NotADirectoryError):
+			# Not cached, the directory may be created later.
+			return None
+
+		logging.debug("snapshot of directory: " + dir_path)
+		return entry_dict
+
+	def getEntry(self, file_path):
+		file_path = os.path.abspath(file_path)
+		dir_path, file_name = os.path.split(file_path)
+
+		if file_name == "":
+			return None
+
+		with self.lock:
+			if dir_path not in self.dir_dict:
+				entry_dict = self.scanDir(dir_path)
+
+				if entry_dict == None:
+					return None
+
+				self.dir_dict[dir_path] = entry_dict
+
+			return self.dir_dict[dir_path].get(file_name)
+
+	def getStat(self, file_path):
+		entry = self.getEntry(file_path)
+
+		if entry == None:
+			return None
+
+		return entry.getStat()
+
+	def isLink(self, file_path):
+		entry = self.getEntry(file_path)
+
+		if entry == None:
+			return False
+
+		return entry.isLink()
+
+	def isFile(self, file_path):
+		stat_result = self.getStat(file_path)
+
+		if stat_result == None:
+			return False
+
+		return stat.S_ISREG(stat_result.st_mode)
+
+	def isDir(self, file_path):
+		stat_result = self.getStat(file_path)
+
+		if stat_result == None:
+			return False
+
+		return stat.S_ISDIR(stat_result.st_mode)
+
+	def exists(self, file_path):
+		return self.getStat(file_path) != None
+
+	def getMtime(self, file_path):
+		stat_result = self.getStat(file_path)
+
+		if stat_result == None:
+			raise FileNotFoundError(file_path)
+
+		return stat_result.st_mtime
+
+	def getRealPath(self, file_path):
+		with self.lock:
+			if file_path not in self.realpath_dict:
+				self.realpath_dict[file_path] = os.path.realpath(file_path)
+
+			return self.realpath_dict[file_path]
+
+	def invalidate(self, file_path):
+		file_path = os.path.abspath(file_path)
+
+		with self.lock:
+			# Symbolic links may have been written or removed.
+			self.realpath_dict = {}
+
+			dir_path, file_name = os.path.split(file_path)
+
+			if dir_path in self.dir_dict:
+				entry_dict = self.dir_dict[dir_path]
+
+				if os.path.lexists(file_path):
+					entry_dict[file_name] = SnapshotEntry(file_path)
+				elif file_name in entry_dict:
+					del entry_dict[file_name]
+
+			# Parent directories may have been created, add them to
+			# their own parent listings without scanning them again.
+			while True:
+				parent_path, dir_name = os.path.split(dir_path)
+
+				if dir_name == "":
+					break
+
+				if parent_path in self.dir_dict:
+					entry_dict = self.dir_dict[parent_path]
+
+					if dir_name not in entry_dict and os.path.isdir(dir_path):
+						entry_dict[dir_name] = SnapshotEntry(dir_path)
+
+				dir_path = parent_path
+
+			# The path may have been a directory.
+			if file_path in self.dir_dict:
+				for dir_path in list(self.dir_dict.keys()):
+					if dir_path == file_path or dir_path.startswith(file_path + os.path.sep):
+						del self.dir_dict[dir_path]
+
+
+snapshot = Snapshot()
+
+
+def isFile(file_path):
+	return snapshot.isFile(file_path)
+
+
+def isLink(file_path):
+	return snapshot.isLink(file_path)
+
+
+def isDir(file_path):
+	return snapshot.isDir(file_path)
+
+
+def exists(file_path):
+	return snapshot.exists(file_path)
+
+
+def getMtime(file_path):
+	return snapshot.getMtime(file_path)
+
+
+def getRealPath(file_path):
+	return snapshot.getRealPath(file_path)
+
+
+def invalidate(file_path):
+	snapshot.invalidate(file_path)
@@ -16,17 +16,34 @@ from Urcheon import Ui
 from collections import OrderedDict
 import logging
 import os
-import tomllib
 
 
 class Game():
 	def __init__(self, source_tree):
 		self.source_dir = source_tree.dir
-		self.profile_fs = Profile.Fs(self.source_dir)
+		self.profile_fs = Profile.getFs(self.source_dir)
 
 		self.key_dict = {}
+		self.compression_dict = {}
+		self.order_dict = {}
+		self.profile_path_list = []
 
-		self.read(source_tree.game_name)
+		cached_profile_dict = self.profile_fs.getCachedProfile("game", source_tree.game_name)
+
+		if cached_profile_dict == None:
+			self.read(source_tree.game_name)
+
+			profile_dict = {
+				"config": self.key_dict,
+				"compression": self.compression_dict,
+				"order": self.order_dict,
+			}
+
+			self.profile_fs.setCachedProfile("game", source_tree.game_name, profile_dict, self.profile_path_list)
+		else:
+			self.key_dict = cached_profile_dict["config"]
+			self.compression_dict = cached_profile_dict["compression"]
+			self.order_dict = cached_profile_dict["order"]
 
 		self.pak_format = self.requireKey("pak")
 		self.pak_ext = os.path.extsep + self.pak_format
@@ -41,9 +58,8 @@ class Game():
 			Ui.error("game profile file not found: " + profile_name)
 
 		logging.debug("reading game profile file " + profile_path)
-		profile_file = open(profile_path, "rb")
-		profile_dict = tomllib.load(profile_file)
-		profile_file.close()
+		profile_dict = Profile.readToml(profile_path)
+		self.profile_path_list.append(profile_path)
 
 		if "_init_" in profile_dict.keys():
 			logging.debug("found “_init_” section in game profile: " + profile_path)
@@ -55,11 +71,25 @@ class Game():
 
 			del profile_dict["_init_"]
 
-		# only one section supported at this time, let's keep it simple
+		# the config section replaces the parent one, let's keep it simple
 		if "config" in profile_dict.keys():
 			logging.debug("config found in game profile file: " + profile_path)
 			self.key_dict = profile_dict["config"]
 
+		# the compression section extends the parent one
+		if "compression" in profile_dict.keys():
+			logging.debug("compression found in game profile file: " + profile_path)
+			for key_name, value in profile_dict["compression"].items():
+				if isinstance(value, dict) and isinstance(self.compression_dict.get(key_name), dict):
+					self.compression_dict[key_name].update(value)
+				else:
+					self.compression_dict[key_name] = value
+
+		# the order section keys replace the parent ones
+		if "order" in profile_dict.keys():
+			logging.debug("order found in game profile file: " + profile_path)
+			self.order_dict.update(profile_dict["order"])
+
 
 	def requireKey(self, key_name):
 		# TODO: strip quotes
@@ -69,6 +99,35 @@ class Game():
 			Ui.error("key not found in pak config: " + key_name)
 
 
+	def getCompressionPolicy(self, file_path):
+		ext = os.path.splitext(file_path)[1][len(os.path.extsep):].lower()
+
+		extension_dict = self.compression_dict.get("extension", {})
+
+		if ext in extension_dict.keys():
+			policy = extension_dict[ext]
+		else:
+			policy = self.compression_dict.get("default", "best")
+
+		if policy not in ["store", "fast", "best", "auto"]:
+			Ui.error("unknown compression policy in game profile: " + str(policy))
+
+		return policy
+
+	def getStoreThreshold(self):
+		return self.compression_dict.get("store_threshold", 0)
+
+	def getExtensionRank(self, file_path):
+		# Files with extensions not listed come last.
+		ext = os.path.splitext(file_path)[1][len(os.path.extsep):].lower()
+
+		extension_list = self.order_dict.get("extension", [])
+
+		if ext in extension_list:
+			return extension_list.index(ext)
+
+		return len(extension_list)
+
 	def getKey(self, key_name):
 		# TODO: strip quotes
 		if key_name in self.key_dict.keys():
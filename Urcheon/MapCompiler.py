@@ -30,7 +30,7 @@ class Config():
 		self.source_dir = source_tree.dir
 		self.game_name = source_tree.game_name
 
-		self.profile_fs = Profile.Fs(self.source_dir)
+		self.profile_fs = Profile.getFs(self.source_dir)
 		self.profile_dict = OrderedDict()
 
 		self.default_profile = None
@@ -68,15 +68,35 @@ class Config():
 		if not config_path:
 			Ui.error("missing map compiler config")
 
-		self.readConfig(config_path)
+		# The same map profile may extend different game profiles.
+		cached_profile_name = config_path + ":" + str(self.game_name)
+		cached_profile_dict = self.profile_fs.getCachedProfile("map", cached_profile_name)
+
+		if cached_profile_dict == None:
+			self.profile_path_list = []
+
+			self.readConfig(config_path)
+
+			profile_dict = {
+				"profile": self.profile_dict,
+				"default": self.default_profile,
+				"source": self.keep_source,
+				"q3map2": self.q3map2_config,
+			}
+
+			self.profile_fs.setCachedProfile("map", cached_profile_name, profile_dict, self.profile_path_list)
+		else:
+			self.profile_dict = OrderedDict(cached_profile_dict["profile"])
+			self.default_profile = cached_profile_dict["default"]
+			self.keep_source = cached_profile_dict["source"]
+			self.q3map2_config = cached_profile_dict["q3map2"]
 
 	def readConfig(self, config_file_name, is_parent=False):
 		config_path = self.profile_fs.getPath(config_file_name)
 
 		logging.debug("reading map config: " + config_path)
-		config_file = open(config_path, "rb")
-		config_dict = tomllib.load(config_file)
-		config_file.close()
+		config_dict = Profile.readToml(config_path)
+		self.profile_path_list.append(config_path)
 
 		if "_init_" in config_dict.keys():
 			logging.debug("found “_init_” section in map profile: " + config_file_name)
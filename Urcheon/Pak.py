@@ -14,19 +14,93 @@ from Urcheon import FileSystem
 from Urcheon import Game
 from Urcheon import MapCompiler
 from Urcheon import Parallelism
+from Urcheon import Pixmap
 from Urcheon import Repository
 from Urcheon import Ui
+from Urcheon import Zip
 import __main__ as m
 import argparse
+import concurrent.futures
+import hashlib
 import logging
 import os
+import re
+import stat
 import sys
-import tempfile
 import time
 import zipfile
+import zlib
 from collections import OrderedDict
-from datetime import datetime
-from operator import attrgetter
+
+
+def getCompression(game_profile, file_path):
+	# Returns the deflate level (None to store)
+	# and the store threshold percentage.
+	policy = game_profile.getCompressionPolicy(file_path)
+
+	return getPolicyCompression(game_profile, policy)
+
+def getPolicyCompression(game_profile, policy):
+	if policy == "store":
+		return None, None
+	elif policy == "fast":
+		return zlib.Z_BEST_SPEED, None
+	elif policy == "best":
+		return zlib.Z_BEST_COMPRESSION, None
+	else:
+		# auto
+		return zlib.Z_BEST_COMPRESSION, game_profile.getStoreThreshold()
+
+
+def getChunkNamePattern(pak_name):
+	# Chunk names are the package name followed by a hash
+	# of the path of their first file, see Packager.splitChunks.
+	return re.compile("^" + re.escape(pak_name) + r"-c[0-9a-f]{8}$")
+
+def getPakName(pak_file):
+	return os.path.basename(pak_file).split("_")[0]
+
+def readPakDeps(reader):
+	# Returns None if the pak has no DEPS file.
+	zip_info = reader.getInfo("DEPS")
+
+	if zip_info == None:
+		return None
+
+	deps = Repository.Deps(None, None)
+	deps.parse(reader.read(zip_info).decode())
+
+	return deps
+
+def getChunkDict(pak_file, deps):
+	# Returns chunk versions by name, in DEPS order.
+	chunk_dict = OrderedDict()
+
+	if deps == None:
+		return chunk_dict
+
+	chunk_name_pattern = getChunkNamePattern(getPakName(pak_file))
+
+	for pak_name in deps.deps_dict.keys():
+		if chunk_name_pattern.match(pak_name):
+			chunk_dict[pak_name] = deps.get(pak_name)
+
+	return chunk_dict
+
+def getChunkFile(pak_file, chunk_name, chunk_version):
+	pak_ext = os.path.splitext(pak_file)[1]
+
+	return os.path.join(os.path.dirname(pak_file), chunk_name + "_" + chunk_version + pak_ext)
+
+
+def isDifferentEntry(old_info, new_info):
+	if old_info == None or new_info == None:
+		return True
+
+	# The date is ignored, files are often rebuilt with the same content.
+	return old_info.CRC != new_info.CRC \
+		or old_info.file_size != new_info.file_size \
+		or old_info.external_attr != new_info.external_attr
 
 
 class MultiRunner():
@@ -38,6 +112,7 @@ class MultiRunner():
 			"prepare": Builder,
 			"build": Builder,
 			"package": Packager,
+			"verify": Verifier,
 		}
 
 	def run(self):
@@ -86,6 +161,18 @@ class Builder():
 			self.keep_dust = False
 		else:
 			self.keep_dust = args.keep_dust
+			source_tree.use_git_object_id = args.git_object_id
+
+		# Only the build stage produces files to be packaged.
+		self.pre_deflate = not is_nested and self.stage_name == "build" and args.pre_deflate
+
+		self.webp_encoder = "cwebp"
+		image_cache_size = Default.image_cache_size
+		if not is_nested and self.stage_name == "build":
+			self.webp_encoder = args.webp_encoder
+			image_cache_size = args.image_cache_size
+
+		self.image_cache = Pixmap.ImageCache(image_cache_size * 1024 * 1024)
 
 		action_list = Action.List(source_tree, self.stage_name, disabled_action_list=disabled_action_list)
 
@@ -142,30 +229,37 @@ class Builder():
 			if self.since_reference:
 				file_repo = Repository.Git(self.source_dir, self.pak_format)
 				file_list = file_repo.listFilesSinceReference(self.since_reference)
+				file_set = set(file_list)
 
 				# also look for untracked files
 				untracked_file_list = file_repo.listUntrackedFiles()
 				for file_name in untracked_file_list:
-					if file_name not in file_list:
+					if file_name not in file_set:
 						logging.debug("found untracked file “" + file_name + "”")
 						# FIXME: next loop will look for prepared files for it, which makes no sense,
 						# is it harmful?
 						file_list.append(file_name)
+						file_set.add(file_name)
 
 				# also look for files produced with “prepare” command
-				# from files modified since this reference
+				# from files modified since this reference,
+				# prepared files are looked for prepared files too
 				paktrace = Repository.Paktrace(source_tree, self.source_dir)
 				input_file_dict = paktrace.getFileDict()["input"]
-				for file_path in file_list:
-					logging.debug("looking for prepared files for “" + str(file_path) + "”")
+				file_index = 0
+				while file_index < len(file_list):
+					file_path = file_list[file_index]
+					file_index += 1
+
 					logging.debug("looking for prepared files for “" + file_path + "”")
 					if file_path in input_file_dict.keys():
 						for input_file_path in input_file_dict[file_path]:
-							if not os.path.exists(os.path.join(self.source_dir, input_file_path)):
+							if not FileSystem.exists(os.path.join(self.source_dir, input_file_path)):
 								logging.debug("missing prepared files for “" + file_path + "”: " + input_file_path)
-							else:
+							elif input_file_path not in file_set:
 								logging.debug("found prepared files for “" + file_path + "”: " + input_file_path)
 								file_list.append(input_file_path)
+								file_set.add(input_file_path)
 			else:
 				file_list = source_tree.listFiles()
 
@@ -174,7 +268,11 @@ class Builder():
 
 		self.action_list = action_list
 
-		self.game_profile = Game.Game(source_tree)
+		if is_nested:
+			self.game_profile = Game.Game(source_tree)
+		else:
+			# Already read when reading the package configuration.
+			self.game_profile = source_tree.pak_config.game_profile
 
 		if not self.map_profile:
 			map_config = MapCompiler.Config(source_tree)
@@ -215,19 +313,37 @@ class Builder():
 		action_thread_list = []
 		produced_unit_list = []
 
+		if self.pre_deflate:
+			# Produced files are deflated while other ones are being built.
+			self.deflate_cache = Zip.DeflateCache(Default.getDeflateDir(self.test_dir))
+			self.deflate_executor = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_count)
+			self.deflate_future_list = []
+
 		main_process = Parallelism.getProcess()
 
+		# Decoded images are only kept for sources converted more
+		# than once, actions already done release their use.
+		for action_type in Action.list():
+			for file_path in self.action_list.active_action_dict[action_type.keyword]:
+				action = action_type(self.source_tree, self.test_dir, file_path, self.stage_name, map_profile=self.map_profile, is_nested=self.is_nested, webp_encoder=self.webp_encoder)
+
+				if action.decodesImage():
+					self.image_cache.expect(action.getSourcePath())
+
 		for action_type in Action.list():
 			for file_path in self.action_list.active_action_dict[action_type.keyword]:
 				# no need to use multiprocessing module to manage task contention, since each task will call its own process
 				# using threads on one core is faster, and it does not prevent tasks to be able to use other cores
 
 				# the is_nested argument is there to tell action to not do specific stuff because of recursion
-				action = action_type(self.source_tree, self.test_dir, file_path, self.stage_name, map_profile=self.map_profile, is_nested=self.is_nested)
+				action = action_type(self.source_tree, self.test_dir, file_path, self.stage_name, map_profile=self.map_profile, is_nested=self.is_nested, webp_encoder=self.webp_encoder, image_cache=self.image_cache)
 
 				# check if task is already done (usually comparing timestamps the make way)
 				if action.isDone():
-					produced_unit_list.extend(action.getOldProducedUnitList())
+					if action.decodesImage():
+						self.image_cache.release(action.getSourcePath())
+
+					produced_unit_list.extend(self.preDeflate(action.getOldProducedUnitList()))
 					continue
 
 				if not self.is_parallel or not action_type.is_parallel:
@@ -244,7 +360,7 @@ class Builder():
 				if not self.is_parallel or not action_type.is_parallel:
 					# sequential build explicitely requested (like in recursion)
 					# or action that can't be run concurrently to others (like MergeBsp)
-					produced_unit_list.extend(action.run())
+					produced_unit_list.extend(self.preDeflate(action.run()))
 				else:
 					# do not use >= in case of there is some extra thread we don't think about
 					# it's better to spawn an extra one than looping forever
@@ -278,7 +394,7 @@ class Builder():
 		# Handle symbolic links.
 		for action_type in Action.list():
 			for file_path in self.action_list.active_action_dict[action_type.keyword]:
-				action = action_type(self.source_tree, self.test_dir, file_path, self.stage_name, action_list=self.action_list, map_profile=self.map_profile, is_nested=self.is_nested)
+				action = action_type(self.source_tree, self.test_dir, file_path, self.stage_name, action_list=self.action_list, map_profile=self.map_profile, is_nested=self.is_nested, webp_encoder=self.webp_encoder)
 
 				# TODO: check for symbolic link to missing or deleted files.
 				produced_unit_list.extend(action.symlink())
@@ -427,16 +543,48 @@ class Builder():
 
 		logging.debug("produced unit list:" + str(produced_unit_list))
 
+		if self.pre_deflate:
+			for future in self.deflate_future_list:
+				future.result()
+
+			self.deflate_executor.shutdown()
+
 		# do not clean-up if building from temporary directories
 		# or if user asked to not clean-up
 		if clean_dust:
 			cleaner.cleanDust(self.test_dir, produced_unit_list, previous_file_list)
 
+		# The prepare stage writes in the source directory.
+		if self.stage_name == "prepare":
+			Repository.getGitCache(self.source_dir).resetStatus()
+
 		return produced_unit_list
 
 	def threadExtendRes(self, func, args, res):
 		# magic: only works if res is a mutable object (like a list)
-		res.extend(func(*args))
+		res.extend(self.preDeflate(func(*args)))
+
+	def preDeflate(self, unit_list):
+		if not self.pre_deflate:
+			return unit_list
+
+		for unit in unit_list:
+			for file_path in unit["body"]:
+				full_path = os.path.join(self.test_dir, file_path)
+
+				# Links are stored, DELETED and DEPS are rewritten at package time.
+				if os.path.islink(full_path) or file_path in Repository.dpk_special_files:
+					continue
+
+				level, store_threshold = getCompression(self.game_profile, file_path)
+
+				if level == None:
+					continue
+
+				future = self.deflate_executor.submit(self.deflate_cache.write, full_path, file_path, level)
+				self.deflate_future_list.append(future)
+
+		return unit_list
 
 
 class Packager():
@@ -452,25 +600,78 @@ class Packager():
 		self.allow_dirty = args.allow_dirty
 		self.no_compress = args.no_compress
 		self.merge_dir = args.merge_dir
+		self.previous_pak = args.previous_pak
+		self.order = args.order
+		self.order_file = args.order_file
 
 		self.test_dir = self.pak_config.getTestDir(args)
 		self.pak_file = self.pak_config.getPakFile(args)
 
-		self.temp_pak_file = self.getTempPakFile()
+		self.game_profile = self.pak_config.game_profile
+
+		# Other archives written from the same read of the files.
+		self.variant_list = []
+		if args.variant_list:
+			for variant_string in args.variant_list:
+				self.variant_list.append(self.parseVariant(variant_string))
+
+		# Files are written in chunk paks the main pak depends on.
+		self.chunk_size = None
+		if args.chunk_size:
+			if self.pak_format != "dpk":
+				Ui.error("chunks are only supported with dpk format", silent=True)
 
-		self.game_profile = Game.Game(source_tree)
+			if self.variant_list:
+				Ui.error("chunks can't be written with package variants", silent=True)
+
+			self.chunk_size = args.chunk_size * 1024 * 1024
 
 		if self.pak_format == "dpk":
 			self.deleted = Repository.Deleted(source_tree, self.test_dir, None)
 			self.deps = Repository.Deps(source_tree, self.test_dir)
 
-	def getTempPakFile(self):
+	def getTempPakFile(self, pak_file):
 		# TODO: add a specific cleaning function for those files
 		# to clean them from older builds if something aborted packaging
-		temp_pak_file_dirname = os.path.dirname(self.pak_file)
-		temp_pak_file_basename = "." + os.path.basename(self.pak_file) + ".temp"
+		temp_pak_file_dirname = os.path.dirname(pak_file)
+		temp_pak_file_basename = "." + os.path.basename(pak_file) + ".temp"
 		return os.path.join(temp_pak_file_dirname, temp_pak_file_basename)
 
+	def parseVariant(self, variant_string):
+		# Example: policy=store,format=pk3,dir=build/test,name=test
+		variant_dict = {
+			"policy": None,
+			"format": self.pak_format,
+			"dir": os.path.dirname(self.pak_file),
+			"name": os.path.splitext(os.path.basename(self.pak_file))[0],
+		}
+
+		for option_string in variant_string.split(","):
+			if "=" not in option_string:
+				Ui.error("malformed variant option: " + option_string, silent=True)
+
+			key_name, value = option_string.split("=", 1)
+
+			if key_name not in variant_dict.keys():
+				Ui.error("unknown variant option: " + key_name, silent=True)
+
+			variant_dict[key_name] = value
+
+		if variant_dict["policy"] not in [None, "profile", "store", "fast", "best", "auto"]:
+			Ui.error("unknown variant compression policy: " + variant_dict["policy"], silent=True)
+
+		if variant_dict["format"] not in ["dpk", "pk3"]:
+			Ui.error("unknown variant format: " + variant_dict["format"], silent=True)
+
+		if variant_dict["format"] == "dpk" and self.pak_format != "dpk":
+			Ui.error("can't write dpk variant of " + self.pak_format + " package", silent=True)
+
+		pak_file = os.path.join(variant_dict["dir"], variant_dict["name"] + os.path.extsep + variant_dict["format"])
+
+		variant_dict["pak_file"] = os.path.abspath(pak_file)
+
+		return variant_dict
+
 	def createSubdirs(self, pak_file):
 		pak_subdir = os.path.dirname(pak_file)
 		if pak_subdir == "":
@@ -482,7 +683,7 @@ class Packager():
 			logging.debug("create pak subdir: " + pak_subdir)
 			os.makedirs(pak_subdir, exist_ok=True)
 
-	def addToPak(self, pak_zipfile, full_path, file_path):
+	def addToPak(self, pak_writer, output_list, full_path, file_path):
 		# TODO: add a mechanism to know if VFS supports
 		# symbolic links in packages or not.
 		# Dæmon's DPK VFS is supporting symbolic links.
@@ -490,32 +691,253 @@ class Packager():
 		# Others may not.
 		is_symlink_supported = True
 		if is_symlink_supported and os.path.islink(full_path):
-			Ui.print("add symlink to package " + os.path.basename(self.pak_file) + ": " + file_path)
+			Ui.print("add symlink to package " + os.path.basename(output_list[0]["pak_file"]) + ": " + file_path)
+
+			# The link is stored uncompressed with the target path as content,
+			# the date is read from the target file.
+			pak_writer.addSymlink(full_path, file_path, self.getOptionList(file_path, output_list))
+		else:
+			Ui.print("add file to package " + os.path.basename(output_list[0]["pak_file"]) + ": " + file_path)
+			pak_writer.addFile(full_path, file_path, self.getOptionList(file_path, output_list))
+
+	def getCompression(self, file_path, policy=None):
+		# Without policy, compression is set by the game profile
+		# and the --no-compress option.
+		if policy == "profile":
+			return getCompression(self.game_profile, file_path)
+
+		if policy != None:
+			return getPolicyCompression(self.game_profile, policy)
+
+		if self.no_compress:
+			return None, None
+
+		return getCompression(self.game_profile, file_path)
+
+	def getOptionList(self, file_path, output_list, is_special=False):
+		# DELETED and DEPS files are only written to dpk.
+		option_list = []
+
+		for output_dict in output_list:
+			if is_special and output_dict["format"] != "dpk":
+				option_list.append(None)
+			else:
+				option_list.append(self.getCompression(file_path, output_dict["policy"]))
 
-			# TODO: Remove this test when Urcheon deletes extra
-			# files in build directory. Currently a deleted but not
-			# committed file is kept.
-			if os.path.exists(full_path):
-				# FIXME: getmtime reads realpath datetime, not symbolic link datetime.
-				file_date_time = (datetime.fromtimestamp(os.path.getmtime(full_path)))
+		return option_list
 
-			# See https://stackoverflow.com/a/61795576/9131399
-			attrs = ('year', 'month', 'day', 'hour', 'minute', 'second')
-			file_date_time_tuple = attrgetter(*attrs)(file_date_time)
+	def readOrderFile(self):
+		# One path per line, as recorded from engine loading.
+		order_dict = {}
 
-			# See https://stackoverflow.com/a/60691331/9131399
-			zip_info = zipfile.ZipInfo(file_path, date_time=file_date_time_tuple)
-			zip_info.create_system = 3
+		if not self.order_file:
+			return order_dict
 
-			file_permissions = 0o777
-			file_permissions |= 0xA000
-			zip_info.external_attr = file_permissions << 16
+		if not os.path.isfile(self.order_file):
+			Ui.error("order file not found: " + self.order_file)
 
-			target_path = os.readlink(full_path)
-			pak_zipfile.writestr(zip_info, target_path)
+		order_file = open(self.order_file, "r")
+		line_list = [line.strip() for line in order_file]
+		order_file.close()
+
+		for line in line_list:
+			if line == "" or line.startswith("#"):
+				continue
+
+			if line not in order_dict:
+				order_dict[line] = len(order_dict)
+
+		return order_dict
+
+	def sortFileList(self, file_list, order_dict):
+		if self.order == "type":
+			def getKey(file_dict):
+				file_path = file_dict["file_path"]
+				return self.game_profile.getExtensionRank(file_path), os.path.dirname(file_path).split("/"), file_path
+		elif self.order == "directory":
+			def getKey(file_dict):
+				file_path = file_dict["file_path"]
+				return os.path.dirname(file_path).split("/"), file_path
+		else:
+			# Paktrace order.
+			index_dict = {}
+			for file_dict in file_list:
+				index_dict[file_dict["file_path"]] = len(index_dict)
+
+			def getKey(file_dict):
+				return index_dict[file_dict["file_path"]]
+
+		# Files from the order file come first.
+		ordered_file_list = [file_dict for file_dict in file_list if file_dict["file_path"] in order_dict]
+		ordered_file_list.sort(key=lambda file_dict: order_dict[file_dict["file_path"]])
+
+		other_file_list = [file_dict for file_dict in file_list if file_dict["file_path"] not in order_dict]
+		other_file_list.sort(key=getKey)
+
+		return ordered_file_list + other_file_list
+
+	def getChunkEntryString(self, file_dict):
+		# Identifies the file content and compression
+		# as it would be written.
+		full_path = file_dict["full_path"]
+		file_path = file_dict["file_path"]
+
+		if os.path.islink(full_path):
+			return file_path + " link " + os.readlink(full_path)
+
+		crc, file_size = Zip.getFileCrc(full_path)
+		file_mode = stat.S_IMODE(os.stat(full_path).st_mode)
+		level, threshold = self.getCompression(file_path)
+
+		return file_path + " " + str(file_size) + " " + str(crc) + " " + oct(file_mode) + " " + str(level) + " " + str(threshold)
+
+	def splitChunks(self, file_list, order_dict):
+		# Files are assigned to chunks in path order, a chunk ends
+		# when the next file would exceed the chunk size, or after
+		# half the chunk size on paths selected by their hash, so
+		# adding or removing a file only changes nearby chunks.
+		pak_name = getPakName(self.pak_file)
+
+		chunk_file_list_list = []
+		chunk_file_list = []
+		chunk_size = 0
+
+		for file_dict in sorted(file_list, key=lambda file_dict: file_dict["file_path"]):
+			file_size = os.lstat(file_dict["full_path"]).st_size
+			path_hash = zlib.crc32(file_dict["file_path"].encode())
+
+			if chunk_file_list:
+				if chunk_size + file_size > self.chunk_size \
+					or (chunk_size >= self.chunk_size // 2 and path_hash % 8 == 0):
+					chunk_file_list_list.append(chunk_file_list)
+					chunk_file_list = []
+					chunk_size = 0
+
+			chunk_file_list.append(file_dict)
+			chunk_size += file_size
+
+		if chunk_file_list:
+			chunk_file_list_list.append(chunk_file_list)
+
+		# The version is a hash of the content, an unchanged chunk
+		# keeps its file name and is not written again.
+		with concurrent.futures.ThreadPoolExecutor(max_workers=Parallelism.countCPU()) as executor:
+			entry_string_list_list = []
+			for chunk_file_list in chunk_file_list_list:
+				entry_string_list_list.append(list(executor.map(self.getChunkEntryString, chunk_file_list)))
+
+		chunk_list = []
+
+		for chunk_file_list, entry_string_list in zip(chunk_file_list_list, entry_string_list_list):
+			chunk_name = pak_name + "-c" + hashlib.sha256(chunk_file_list[0]["file_path"].encode()).hexdigest()[:8]
+			chunk_version = hashlib.sha256("\n".join(entry_string_list).encode()).hexdigest()[:16]
+
+			chunk_file = getChunkFile(self.pak_file, chunk_name, chunk_version)
+
+			chunk_dict = {
+				"name": chunk_name,
+				"version": chunk_version,
+				"pak_file": chunk_file,
+				"file_list": self.sortFileList(chunk_file_list, order_dict),
+			}
+
+			chunk_list.append(chunk_dict)
+
+		return chunk_list
+
+	def writeChunk(self, chunk_dict, deflate_cache, repo_date):
+		pak_file = chunk_dict["pak_file"]
+
+		if os.path.isfile(pak_file):
+			Ui.print("Keeping unchanged chunk: " + pak_file)
+			return
+
+		Ui.print("Packaging chunk as: " + pak_file)
+
+		self.createSubdirs(pak_file)
+
+		output_list = [
+			{
+				"pak_file": pak_file,
+				"format": self.pak_format,
+				"policy": None,
+			}
+		]
+
+		temp_pak_file = self.getTempPakFile(pak_file)
+
+		pak_writer = Zip.MultiWriter([ Zip.Writer(temp_pak_file, deflate_cache=deflate_cache) ])
+
+		for file_dict in chunk_dict["file_list"]:
+			self.addToPak(pak_writer, output_list, file_dict["full_path"], file_dict["file_path"])
+
+		pak_writer.close()
+
+		if repo_date != None:
+			os.utime(temp_pak_file, (repo_date, repo_date))
+
+		logging.debug("Renaming “" + temp_pak_file +"” as: " + pak_file)
+
+		os.rename(temp_pak_file, pak_file)
+
+		Ui.laconic("Chunk written: " + pak_file)
+
+	def cleanChunks(self):
+		# Chunks no main pak of this package depends on are removed,
+		# chunks of older main paks are kept as long as those paks
+		# are in the same directory.
+		pak_dir = os.path.dirname(self.pak_file)
+		pak_name = getPakName(self.pak_file)
+		pak_ext = os.path.splitext(self.pak_file)[1]
+		chunk_name_pattern = getChunkNamePattern(pak_name)
+
+		referenced_file_set = set()
+		chunk_file_list = []
+
+		for file_name in sorted(os.listdir(pak_dir)):
+			if not file_name.endswith(pak_ext) or "_" not in file_name:
+				continue
+
+			file_path = os.path.join(pak_dir, file_name)
+
+			if chunk_name_pattern.match(getPakName(file_name)):
+				chunk_file_list.append(file_path)
+				continue
+
+			if getPakName(file_name) != pak_name:
+				continue
+
+			try:
+				reader = Zip.Reader(file_path)
+			except (zipfile.BadZipFile, OSError) as error:
+				Ui.warning("can't read package, keeping its chunks: " + file_path + ", " + str(error))
+				return
+
+			chunk_dict = getChunkDict(file_path, readPakDeps(reader))
+			reader.close()
+
+			for chunk_name, chunk_version in chunk_dict.items():
+				referenced_file_set.add(getChunkFile(file_path, chunk_name, chunk_version))
+
+		for chunk_file in chunk_file_list:
+			if chunk_file not in referenced_file_set:
+				Ui.print("Removing unreferenced chunk: " + chunk_file)
+				os.remove(chunk_file)
+
+	def openPreviousPak(self, pak_file, previous_pak=None):
+		if previous_pak:
+			if not os.path.isfile(previous_pak):
+				Ui.error("previous pak not found: " + previous_pak)
+		elif os.path.isfile(pak_file):
+			previous_pak = pak_file
 		else:
-			Ui.print("add file to package " + os.path.basename(self.pak_file) + ": " + file_path)
-			pak_zipfile.write(full_path, arcname=file_path)
+			return None
+
+		try:
+			return Zip.Reader(previous_pak)
+		except (OSError, zipfile.BadZipFile):
+			Ui.warning("unreadable previous pak, will not reuse it: " + previous_pak)
+			return None
 
 	def run(self):
 		if not os.path.isdir(self.test_dir):
@@ -530,18 +952,27 @@ class Packager():
 
 		Ui.print("Packaging “" + self.test_dir + "” as: " + self.pak_file)
 
-		self.createSubdirs(self.pak_file)
-		logging.debug("opening: " + self.temp_pak_file)
+		output_list = [
+			{
+				"pak_file": self.pak_file,
+				"format": self.pak_format,
+				"policy": None,
+			}
+		]
 
-		if self.no_compress:
-			# why zlib.Z_NO_COMPRESSION not defined?
-			zipfile.zlib.Z_DEFAULT_COMPRESSION = 0
-		else:
-			# maximum compression
-			zipfile.zlib.Z_DEFAULT_COMPRESSION = zipfile.zlib.Z_BEST_COMPRESSION
+		output_list += self.variant_list
+
+		pak_file_list = [output_dict["pak_file"] for output_dict in output_list]
+		for pak_file in pak_file_list:
+			if pak_file_list.count(pak_file) > 1:
+				Ui.error("package variants must be written to different files: " + pak_file, silent=True)
+
+			if pak_file != self.pak_file:
+				Ui.print("Packaging “" + self.test_dir + "” variant as: " + pak_file)
 
 		paktrace_dir = Default.getPakTraceDir(self.test_dir)
 		relative_paktrace_dir = os.path.relpath(paktrace_dir, self.test_dir)
+		relative_deflate_dir = os.path.relpath(Default.getDeflateDir(self.test_dir), self.test_dir)
 
 		paktrace = Repository.Paktrace(self.source_tree, self.test_dir)
 		built_file_list = paktrace.listAll()
@@ -557,6 +988,10 @@ class Packager():
 				if file_path.startswith(relative_paktrace_dir + os.path.sep):
 					continue
 
+				# ignore files deflated at build time
+				if file_path.startswith(relative_deflate_dir + os.path.sep):
+					continue
+
 				# ignore DELETED and DEPS file, will add it later
 				if self.pak_format == "dpk" and file_path in Repository.dpk_special_files:
 					continue
@@ -569,7 +1004,7 @@ class Packager():
 		for file_path in built_file_list:
 			full_path = os.path.join(self.test_dir, file_path)
 
-			if not os.path.exists(full_path):
+			if not FileSystem.exists(full_path):
 				Ui.error("Missing " + full_path)
 
 			file_dict = {
@@ -580,8 +1015,37 @@ class Packager():
 			test_file_list.append(file_dict)
 
 		merge_file_list = []
+		merge_reader = None
+
+		if self.merge_dir and os.path.isfile(self.merge_dir):
+			# Entries of merged archives are copied as is.
+			try:
+				merge_reader = Zip.Reader(self.merge_dir)
+			except zipfile.BadZipFile:
+				Ui.error("unreadable archive to merge: " + self.merge_dir, silent=True)
+
+			for zip_info in merge_reader.listInfo():
+				if zip_info.is_dir():
+					continue
 
-		if self.merge_dir:
+				file_path = zip_info.filename
+
+				# unsupported paktrace files
+				if file_path.startswith(relative_paktrace_dir.replace(os.path.sep, "/") + "/"):
+					Ui.error("Merging urcheon-built pak is not supported", silent=True)
+
+				# unsupported DELETED and DEPS file
+				if self.pak_format == "dpk" and file_path in Repository.dpk_special_files:
+					Ui.error("Merging urcheon-built pak is not supported", silent=True)
+
+				file_dict = {
+					"zip_info": zip_info,
+					"file_path": file_path,
+				}
+
+				merge_file_list.append(file_dict)
+
+		elif self.merge_dir:
 			for dir_name, subdir_name_list, file_name_list in os.walk(self.merge_dir):
 				for file_name in file_name_list:
 					full_path = os.path.join(dir_name, file_name)
@@ -608,49 +1072,477 @@ class Packager():
 			Ui.print("Not writing empty package: " + self.pak_file)
 			return
 
-		pak_zipfile = zipfile.ZipFile(self.temp_pak_file, "w", zipfile.ZIP_DEFLATED)
+		# Entry order, for the engine to read the pak sequentially.
+		order_dict = self.readOrderFile()
+		test_file_list = self.sortFileList(test_file_list, order_dict)
+		merge_file_list = self.sortFileList(merge_file_list, order_dict)
+
+		# Files deflated at build time.
+		deflate_cache = None
+		deflate_dir = Default.getDeflateDir(self.test_dir)
+		if os.path.isdir(deflate_dir):
+			deflate_cache = Zip.DeflateCache(deflate_dir)
+
+		repo_date = None
+		if source_repository.isGit():
+			repo_date = int(source_repository.getDate("HEAD"))
+
+		chunk_list = []
+
+		if self.chunk_size:
+			# Only DEPS and DELETED files and merged archives
+			# are written in the main pak.
+			chunk_file_list = test_file_list
+			test_file_list = []
+
+			if not merge_reader:
+				chunk_file_list += merge_file_list
+				merge_file_list = []
+
+			chunk_list = self.splitChunks(chunk_file_list, order_dict)
+
+			for chunk_dict in chunk_list:
+				self.writeChunk(chunk_dict, deflate_cache, repo_date)
+
+		writer_list = []
+		for output_dict in output_list:
+			pak_file = output_dict["pak_file"]
+
+			self.createSubdirs(pak_file)
+			temp_pak_file = self.getTempPakFile(pak_file)
+			logging.debug("opening: " + temp_pak_file)
+
+			# Reuse compressed data of unmodified files.
+			if pak_file == self.pak_file:
+				previous_reader = self.openPreviousPak(pak_file, previous_pak=self.previous_pak)
+			else:
+				previous_reader = self.openPreviousPak(pak_file)
+
+			writer_list.append(Zip.Writer(temp_pak_file, previous_reader=previous_reader, deflate_cache=deflate_cache))
+
+		# Files are read once, compressed in parallel and written in order.
+		pak_writer = Zip.MultiWriter(writer_list)
 
 		for file_dict in test_file_list:
-			self.addToPak(pak_zipfile, file_dict["full_path"], file_dict["file_path"])
+			self.addToPak(pak_writer, output_list, file_dict["full_path"], file_dict["file_path"])
 
-		if self.merge_dir:
+		if merge_reader:
+			Ui.print("Merging " + self.merge_dir + " archive")
+			for file_dict in merge_file_list:
+				Ui.print("add file to package " + os.path.basename(self.pak_file) + ": " + file_dict["file_path"])
+				pak_writer.addArchived(merge_reader, file_dict["zip_info"], self.getOptionList(file_dict["file_path"], output_list))
+		elif merge_file_list:
 			Ui.print("Merging " + self.merge_dir + " directory")
 			for file_dict in merge_file_list:
-				self.addToPak(pak_zipfile, file_dict["full_path"], file_dict["file_path"])
+				self.addToPak(pak_writer, output_list, file_dict["full_path"], file_dict["file_path"])
 
 		if self.pak_format == "dpk":
 			# Writing DELETED file.
 			deleted_file_path = self.deleted.get_test_path()
 			if os.path.isfile(deleted_file_path):
-					pak_zipfile.write(deleted_file_path, arcname="DELETED")
+					pak_writer.addFile(deleted_file_path, "DELETED", self.getOptionList("DELETED", output_list, is_special=True))
 
 			# Translating DEPS file.
-			if self.deps.read(deps_dir=self.test_dir):
+			has_deps = self.deps.read(deps_dir=self.test_dir)
+
+			if has_deps:
 				self.deps.translateRelease(self.pak_vfs)
 
-				deps_temp_dir = tempfile.mkdtemp()
-				deps_temp_file = self.deps.write(deps_dir=deps_temp_dir)
+			# Chunks are loaded as dependencies.
+			for chunk_dict in chunk_list:
+				self.deps.set(chunk_dict["name"], chunk_dict["version"])
+				has_deps = True
+
+			if has_deps:
 				Ui.print("add file to package " + os.path.basename(self.pak_file) + ": DEPS")
-				pak_zipfile.write(deps_temp_file, arcname="DEPS")
+				pak_writer.addBytes("DEPS", self.deps.produce().encode(), self.getOptionList("DEPS", output_list, is_special=True))
 
-		logging.debug("close: " + self.temp_pak_file)
-		pak_zipfile.close()
+		pak_writer.close()
 
-		if source_repository.isGit():
-			repo_date = int(source_repository.getDate("HEAD"))
-			os.utime(self.temp_pak_file, (repo_date, repo_date))
+		if merge_reader:
+			merge_reader.close()
 
-		# remove existing file (do not write in place) to force the game engine to reread the file
-		# maybe the renaming of the temp file already makes sure the file is not the same one anyway
-		if os.path.isfile(self.pak_file):
-			logging.debug("remove existing package: " + self.pak_file)
-			os.remove(self.pak_file)
+		for output_dict, writer in zip(output_list, writer_list):
+			pak_file = output_dict["pak_file"]
+			temp_pak_file = writer.file_path
 
-		logging.debug("Renaming “" + self.temp_pak_file +"” as: " + self.pak_file)
+			if deflate_cache:
+				Ui.laconic("Used " + str(writer.cached_count) + " files deflated at build time for: " + pak_file)
 
-		os.rename(self.temp_pak_file, self.pak_file)
+			if writer.previous_reader:
+				Ui.laconic("Reused " + str(writer.reused_count) + " compressed files from: " + writer.previous_reader.file_path)
+				writer.previous_reader.close()
 
-		Ui.laconic("Package written: " + self.pak_file)
+			if repo_date != None:
+				os.utime(temp_pak_file, (repo_date, repo_date))
+
+			# remove existing file (do not write in place) to force the game engine to reread the file
+			# maybe the renaming of the temp file already makes sure the file is not the same one anyway
+			if os.path.isfile(pak_file):
+				logging.debug("remove existing package: " + pak_file)
+				os.remove(pak_file)
+
+			logging.debug("Renaming “" + temp_pak_file +"” as: " + pak_file)
+
+			os.rename(temp_pak_file, pak_file)
+
+			Ui.laconic("Package written: " + pak_file)
+
+		if self.chunk_size:
+			self.cleanChunks()
+
+
+class Verifier():
+	# Checks a pak against its built pakdir using the central
+	# directory, without extracting anything.
+	def __init__(self, source_tree, args):
+		self.source_tree = source_tree
+
+		self.pak_vfs = source_tree.pak_vfs
+		self.pak_config = source_tree.pak_config
+		self.pak_format = source_tree.pak_format
+
+		self.test_dir = self.pak_config.getTestDir(args)
+		self.pak_file = self.pak_config.getPakFile(args)
+
+		if self.pak_format == "dpk":
+			self.deleted = Repository.Deleted(source_tree, self.test_dir, None)
+			self.deps = Repository.Deps(source_tree, self.test_dir)
+
+	def checkFile(self, reader_dict, full_path, file_path):
+		# Returns what differs, or None.
+		if file_path not in reader_dict:
+			return "missing file in package"
+
+		reader = reader_dict[file_path]
+		zip_info = reader.getInfo(file_path)
+
+		is_zip_symlink = stat.S_ISLNK(zip_info.external_attr >> 16)
+
+		if os.path.islink(full_path):
+			if not is_zip_symlink:
+				return "not a symlink in package"
+
+			if reader.read(zip_info).decode() != os.readlink(full_path):
+				return "different symlink target in package"
+
+			return None
+
+		if is_zip_symlink:
+			return "symlink in package"
+
+		if not os.path.isfile(full_path):
+			return "missing file in pakdir"
+
+		crc, file_size = Zip.getFileCrc(full_path)
+
+		if file_size != zip_info.file_size:
+			return "different size in package"
+
+		if crc != zip_info.CRC:
+			return "different CRC in package"
+
+		return None
+
+	def checkData(self, reader, file_path, data):
+		# Data is None if the file must not be there.
+		zip_info = reader.getInfo(file_path)
+
+		if zip_info == None:
+			if data != None:
+				return "missing file in package"
+
+			return None
+
+		if data == None:
+			return "extraneous file in package"
+
+		if reader.read(zip_info) != data:
+			return "different content in package"
+
+		return None
+
+	def run(self):
+		if not os.path.isdir(self.test_dir):
+			Ui.error("test pakdir not built: " + self.test_dir)
+
+		if not os.path.isfile(self.pak_file):
+			Ui.error("package not found: " + self.pak_file, silent=True)
+
+		Ui.print("Verifying “" + self.pak_file + "” against: " + self.test_dir)
+
+		paktrace = Repository.Paktrace(self.source_tree, self.test_dir)
+		built_file_list = paktrace.listAll()
+
+		reader = Zip.Reader(self.pak_file)
+		reader_list = [ reader ]
+
+		difference_count = 0
+
+		# Files written in chunks are looked for in the chunk paks
+		# the main pak depends on.
+		chunk_dict = OrderedDict()
+		if self.pak_format == "dpk":
+			chunk_dict = getChunkDict(self.pak_file, readPakDeps(reader))
+
+		for chunk_name, chunk_version in chunk_dict.items():
+			chunk_file = getChunkFile(self.pak_file, chunk_name, chunk_version)
+
+			if not os.path.isfile(chunk_file):
+				Ui.warning("missing chunk: " + chunk_file)
+				difference_count += 1
+				continue
+
+			Ui.print("Verifying chunk: " + chunk_file)
+			reader_list.append(Zip.Reader(chunk_file))
+
+		reader_dict = {}
+		for chunk_reader in reversed(reader_list):
+			for zip_info in chunk_reader.listInfo():
+				if not zip_info.is_dir():
+					reader_dict[zip_info.filename] = chunk_reader
+
+		# Files are read in parallel, only the CRC is computed.
+		with concurrent.futures.ThreadPoolExecutor(max_workers=Parallelism.countCPU()) as executor:
+			future_list = []
+			for file_path in built_file_list:
+				full_path = os.path.join(self.test_dir, file_path)
+				future_list.append(executor.submit(self.checkFile, reader_dict, full_path, file_path))
+
+			for file_path, future in zip(built_file_list, future_list):
+				message = future.result()
+
+				if message:
+					Ui.warning(message + ": " + file_path)
+					difference_count += 1
+
+		special_file_list = []
+
+		if self.pak_format == "dpk":
+			special_file_list = Repository.dpk_special_files
+
+			deleted_data = None
+			deleted_file_path = self.deleted.get_test_path()
+			if os.path.isfile(deleted_file_path):
+				deleted_file = open(deleted_file_path, "rb")
+				deleted_data = deleted_file.read()
+				deleted_file.close()
+
+			# DEPS are translated the same way when packaging.
+			deps_data = None
+			has_deps = self.deps.read(deps_dir=self.test_dir)
+
+			if has_deps:
+				self.deps.translateRelease(self.pak_vfs)
+
+			for chunk_name, chunk_version in chunk_dict.items():
+				self.deps.set(chunk_name, chunk_version)
+				has_deps = True
+
+			if has_deps:
+				deps_data = self.deps.produce().encode()
+
+			for file_path, data in [ ("DELETED", deleted_data), ("DEPS", deps_data) ]:
+				message = self.checkData(reader, file_path, data)
+
+				if message:
+					Ui.warning(message + ": " + file_path)
+					difference_count += 1
+
+		built_file_set = set(built_file_list)
+
+		for chunk_reader in reader_list:
+			for zip_info in chunk_reader.listInfo():
+				file_path = zip_info.filename
+
+				if zip_info.is_dir() or file_path in built_file_set:
+					continue
+
+				# Chunks don't have DEPS or DELETED files.
+				if chunk_reader == reader and file_path in special_file_list:
+					continue
+
+				Ui.warning("extraneous file in package: " + file_path)
+				difference_count += 1
+
+		for chunk_reader in reader_list:
+			chunk_reader.close()
+
+		if difference_count:
+			Ui.error(str(difference_count) + " differences found in package: " + self.pak_file, silent=True)
+
+		Ui.laconic("Package verified: " + self.pak_file)
+
+
+class Comparator():
+	# Compares two paks using their central directory.
+	def __init__(self, first_pak_file, second_pak_file):
+		self.first_pak_file = first_pak_file
+		self.second_pak_file = second_pak_file
+
+	def run(self):
+		for pak_file in [ self.first_pak_file, self.second_pak_file ]:
+			if not os.path.isfile(pak_file):
+				Ui.error("pak not found: " + pak_file, silent=True)
+
+		Ui.print("Comparing “" + self.first_pak_file + "” with: " + self.second_pak_file)
+
+		first_reader = Zip.Reader(self.first_pak_file)
+		second_reader = Zip.Reader(self.second_pak_file)
+
+		difference_count = 0
+
+		for first_info in first_reader.listInfo():
+			file_path = first_info.filename
+			second_info = second_reader.getInfo(file_path)
+
+			if second_info == None:
+				Ui.warning("only in " + self.first_pak_file + ": " + file_path)
+				difference_count += 1
+			elif isDifferentEntry(first_info, second_info):
+				Ui.warning("different file: " + file_path)
+				difference_count += 1
+
+		for second_info in second_reader.listInfo():
+			file_path = second_info.filename
+
+			if first_reader.getInfo(file_path) == None:
+				Ui.warning("only in " + self.second_pak_file + ": " + file_path)
+				difference_count += 1
+
+		first_reader.close()
+		second_reader.close()
+
+		if difference_count:
+			Ui.error(str(difference_count) + " differences found between packages", silent=True)
+
+		Ui.laconic("Packages have the same files: " + self.first_pak_file + ", " + self.second_pak_file)
+
+
+class Delta():
+	# Writes a partial pak with the files of the new pak that
+	# are not in the old one, only reading central directories,
+	# so it works without the source repository.
+	def __init__(self, old_pak_file, new_pak_file, delta_pak_file):
+		self.old_pak_file = old_pak_file
+		self.new_pak_file = new_pak_file
+		self.delta_pak_file = os.path.abspath(delta_pak_file)
+
+		temp_pak_file_dirname = os.path.dirname(self.delta_pak_file)
+		temp_pak_file_basename = "." + os.path.basename(self.delta_pak_file) + ".temp"
+		self.temp_pak_file = os.path.join(temp_pak_file_dirname, temp_pak_file_basename)
+
+		# Used for DEPS and DELETED files, like the default game profile.
+		self.level = 9
+
+	def getPakNameVersion(self, pak_file):
+		base_name = os.path.basename(pak_file)
+		pak_ext = os.path.splitext(base_name)[1]
+
+		if pak_ext != ".dpk" or "_" not in base_name:
+			Ui.error("not a versioned dpk file: " + pak_file, silent=True)
+
+		pak_name = base_name.split("_")[0]
+		pak_version = base_name[len(pak_name) + 1:-len(pak_ext)]
+
+		return pak_name, pak_version
+
+	def createSubdirs(self):
+		pak_subdir = os.path.dirname(self.delta_pak_file)
+		os.makedirs(pak_subdir, exist_ok=True)
+
+	def run(self):
+		for pak_file in [ self.old_pak_file, self.new_pak_file ]:
+			if not os.path.isfile(pak_file):
+				Ui.error("pak not found: " + pak_file, silent=True)
+
+		old_pak_name, old_pak_version = self.getPakNameVersion(self.old_pak_file)
+		new_pak_name, new_pak_version = self.getPakNameVersion(self.new_pak_file)
+
+		if old_pak_name != new_pak_name:
+			Ui.error("can't compute delta between different paks: " + old_pak_name + ", " + new_pak_name, silent=True)
+
+		Ui.print("Computing delta from “" + self.old_pak_file + "” to: " + self.new_pak_file)
+
+		old_reader = Zip.Reader(self.old_pak_file)
+		new_reader = Zip.Reader(self.new_pak_file)
+
+		changed_info_list = []
+		for new_info in new_reader.listInfo():
+			file_path = new_info.filename
+
+			if new_info.is_dir() or file_path in Repository.dpk_special_files:
+				continue
+
+			if isDifferentEntry(old_reader.getInfo(file_path), new_info):
+				changed_info_list.append(new_info)
+
+		deleted_file_list = []
+		for old_info in old_reader.listInfo():
+			file_path = old_info.filename
+
+			if old_info.is_dir() or file_path in Repository.dpk_special_files:
+				continue
+
+			if new_reader.getInfo(file_path) == None:
+				deleted_file_list.append(file_path)
+
+		if not changed_info_list and not deleted_file_list:
+			Ui.print("Not writing empty package: " + self.delta_pak_file)
+			old_reader.close()
+			new_reader.close()
+			return
+
+		# Keep what the new pak deletes from other paks
+		# and what it depends on.
+		deleted = Repository.Deleted(None, None, None)
+		deps = Repository.Deps(None, None)
+
+		deleted_info = new_reader.getInfo("DELETED")
+		if deleted_info:
+			deleted.parse(new_reader.read(deleted_info).decode())
+
+		deps_info = new_reader.getInfo("DEPS")
+		if deps_info:
+			deps.parse(new_reader.read(deps_info).decode())
+
+		for deleted_file_dict in deleted.deleted_file_list:
+			deleted.setPart(deleted_file_dict["pak_name"], deleted_file_dict["file_path"])
+
+		for file_path in deleted_file_list:
+			deleted.setPart(new_pak_name, file_path)
+
+		# The delta is loaded over the old pak.
+		deps.set(new_pak_name, old_pak_version)
+
+		self.createSubdirs()
+
+		pak_writer = Zip.Writer(self.temp_pak_file)
+
+		for new_info in changed_info_list:
+			Ui.print("add file to package " + os.path.basename(self.delta_pak_file) + ": " + new_info.filename)
+			pak_writer.addArchived(new_reader, new_info)
+
+		if deleted.deleted_part_list:
+			Ui.print("add file to package " + os.path.basename(self.delta_pak_file) + ": DELETED")
+			pak_writer.addBytes("DELETED", deleted.produce().encode(), level=self.level)
+
+		Ui.print("add file to package " + os.path.basename(self.delta_pak_file) + ": DEPS")
+		pak_writer.addBytes("DEPS", deps.produce().encode(), level=self.level)
+
+		pak_writer.close()
+
+		old_reader.close()
+		new_reader.close()
+
+		new_pak_mtime = os.stat(self.new_pak_file).st_mtime
+		os.utime(self.temp_pak_file, (new_pak_mtime, new_pak_mtime))
+
+		logging.debug("Renaming “" + self.temp_pak_file +"” as: " + self.delta_pak_file)
+
+		os.replace(self.temp_pak_file, self.delta_pak_file)
+
+		Ui.laconic("Delta package written with " + str(len(changed_info_list)) + " modified and " + str(len(deleted_file_list)) + " deleted files: " + self.delta_pak_file)
 
 
 class Cleaner():
@@ -658,7 +1550,7 @@ class Cleaner():
 
 		self.pak_name = source_tree.pak_name
 
-		self.game_profile = Game.Game(source_tree)
+		self.game_profile = source_tree.pak_config.game_profile
 
 
 	def cleanTest(self, test_dir):
@@ -736,14 +1628,25 @@ class Cleaner():
 			if file_name not in produced_file_list:
 				dust_file_path = os.path.normpath(os.path.join(test_dir, file_name))
 				Ui.laconic("clean dust file: " + file_name)
-				dust_file_fullpath = os.path.realpath(dust_file_path)
+				dust_file_fullpath = FileSystem.getRealPath(dust_file_path)
 
-				if not os.path.isfile(dust_file_fullpath):
+				if not FileSystem.isFile(dust_file_fullpath):
 					# if you're there, it's because you are debugging a crash
 					continue
 
 				FileSystem.cleanRemoveFile(dust_file_fullpath)
 
+		deflate_dir = Default.getDeflateDir(test_dir)
+
+		if os.path.isdir(deflate_dir):
+			logging.debug("look for dust in directory: " + deflate_dir)
+			deflate_cache = Zip.DeflateCache(deflate_dir)
+
+			for file_name in deflate_cache.listFiles():
+				if file_name not in produced_file_list:
+					logging.debug("clean dust deflated file: " + file_name)
+					deflate_cache.remove(file_name)
+
 		paktrace_dir = Default.getPakTraceDir(test_dir)
 
 		if os.path.isdir(paktrace_dir):
@@ -7,17 +7,22 @@
 # License: ISC
 #
 
-import psutil
 import subprocess
 import threading
 
+# The psutil module is only imported when needed since
+# importing it is slow and short commands don't need it.
 
-getProcess = psutil.Process
+
+def getProcess():
+	import psutil
+	return psutil.Process()
 
 
 def countCPU():
 	# Reuse computed value
 	if not hasattr(countCPU, "count"):
+		import psutil
 		countCPU.count = psutil.cpu_count()
 
 	return countCPU.count
@@ -27,6 +32,7 @@ def countThread(process):
 	# process can disappear between the time
 	# this function is called and the num_threads()
 	# one is called, in this case return 0
+	import psutil
 	try:
 		return process.num_threads()
 	except (psutil.NoSuchProcess, psutil.ZombieProcess):
@@ -37,6 +43,7 @@ def countChildThread(process):
 	# process can disappear between the time
 	# this function is called and the children()
 	# one is called, in this case return 0
+	import psutil
 	try:
 		thread_count = 0
 		# process.children() is super slow
@@ -0,0 +1,178 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+from collections import OrderedDict
+import logging
+import os
+import struct
+import threading
+
+# Pillow is not imported by this module, images are given by
+# callers that already imported it, importing it is slow.
+
+
+# Pillow mishandles greyscale and 16-bit PNG images when converting
+# them to RGB, those are decoded by cwebp instead.
+sane_png_mode_list = ["1", "P", "PA", "RGB", "RGBA"]
+
+def isSanePngMode(image):
+	return image.mode in sane_png_mode_list
+
+def isOpaque(image):
+	# Tells if no pixel of the RGBA image is transparent,
+	# the alpha channel is scanned by Pillow in C.
+	alpha_min, alpha_max = image.getchannel("A").getextrema()
+
+	return alpha_min == 255
+
+def stripOpaqueAlpha(image):
+	# Returns the RGBA image as RGB if its alpha channel is useless.
+	if isOpaque(image):
+		return image.convert("RGB")
+
+	return image
+
+def isLosslessWebp(file_path):
+	# Reads the RIFF chunks of the WebP file, lossless images use
+	# a VP8L bitstream and lossy ones a VP8 bitstream, extended
+	# images store them after other chunks, animated images in
+	# their frames. Returns None if no bitstream is found.
+	file_handle = open(file_path, "rb")
+	riff_header = file_handle.read(12)
+
+	if len(riff_header) != 12 or riff_header[0:4] != b"RIFF" or riff_header[8:12] != b"WEBP":
+		file_handle.close()
+		return None
+
+	is_lossless = None
+
+	while True:
+		chunk_header = file_handle.read(8)
+
+		if len(chunk_header) != 8:
+			break
+
+		chunk_name = chunk_header[0:4]
+		chunk_size = struct.unpack("<L", chunk_header[4:8])[0]
+
+		if chunk_name == b"VP8L":
+			is_lossless = True
+			break
+
+		if chunk_name == b"VP8 ":
+			is_lossless = False
+			break
+
+		if chunk_name == b"ANMF":
+			# Frame chunks start with a 16-byte frame header
+			# followed by the frame chunks.
+			file_handle.seek(16, 1)
+			continue
+
+		# Chunks are padded to an even size.
+		file_handle.seek(chunk_size + (chunk_size & 1), 1)
+
+	file_handle.close()
+
+	return is_lossless
+
+class ImageCache():
+	# Keeps decoded images of sources converted more than once,
+	# for example when the action list converts the same source
+	# to multiple formats. Other sources are never stored.
+	# Images are dropped after their last expected use, or least
+	# recently used ones when the size limit is reached.
+	# Images are copied when read since callers may modify them.
+	def __init__(self, size_limit):
+		self.size_limit = size_limit
+		self.size = 0
+		self.use_count_dict = {}
+		self.image_dict = OrderedDict()
+		self.lock = threading.Lock()
+
+	def expect(self, source_path):
+		# Tells the source will be converted once more.
+		with self.lock:
+			self.use_count_dict[source_path] = self.use_count_dict.get(source_path, 0) + 1
+
+	def release(self, source_path):
+		# Tells one expected conversion won't happen.
+		with self.lock:
+			self.use_count_dict[source_path] = self.use_count_dict.get(source_path, 0) - 1
+
+			if self.use_count_dict[source_path] <= 0 and source_path in self.image_dict:
+				self.drop(source_path)
+
+	def getStamp(self, source_path):
+		# A modified source is decoded again.
+		file_stat = os.stat(source_path)
+
+		return (file_stat.st_mtime_ns, file_stat.st_size)
+
+	def getImageSize(self, image):
+		return image.width * image.height * len(image.getbands())
+
+	def drop(self, source_path):
+		stamp, image = self.image_dict.pop(source_path)
+		self.size -= self.getImageSize(image)
+
+		return image
+
+	def get(self, source_path):
+		with self.lock:
+			if source_path not in self.image_dict:
+				return None
+
+			stamp, image = self.image_dict[source_path]
+
+			if stamp != self.getStamp(source_path):
+				self.drop(source_path)
+				return None
+
+			self.use_count_dict[source_path] -= 1
+
+			# The last use gets the cached image itself.
+			if self.use_count_dict[source_path] <= 0:
+				return self.drop(source_path)
+
+			self.image_dict.move_to_end(source_path)
+
+		return image.copy()
+
+	def set(self, source_path, image):
+		with self.lock:
+			# The image being set is used by the caller.
+			use_count = self.use_count_dict.get(source_path, 0) - 1
+			self.use_count_dict[source_path] = use_count
+
+			if use_count <= 0:
+				if source_path in self.image_dict:
+					self.drop(source_path)
+
+				return
+
+			if source_path in self.image_dict:
+				return
+
+		image_size = self.getImageSize(image)
+
+		if image_size > self.size_limit:
+			return
+
+		stamp = self.getStamp(source_path)
+		image = image.copy()
+
+		with self.lock:
+			self.image_dict[source_path] = (stamp, image)
+			self.size += image_size
+
+			while self.size > self.size_limit:
+				dropped_path = next(iter(self.image_dict))
+				self.drop(dropped_path)
+				logging.debug("dropped decoded image from cache: " + dropped_path)
@@ -10,26 +10,217 @@
 
 from Urcheon import Default
 from Urcheon import Ui
+import copy
+import hashlib
+import json
 import logging
 import os
 import sys
+import tempfile
+import threading
+import tomllib
+
+
+# Profile directories are walked and profile files are parsed
+# only once per process, whatever the amount of consumers.
+fs_dict = {}
+toml_dict = {}
+registry_lock = threading.RLock()
+
+
+def getFs(source_dir):
+	source_real_dir = os.path.realpath(source_dir)
+
+	with registry_lock:
+		if source_real_dir not in fs_dict:
+			fs_dict[source_real_dir] = Fs(source_real_dir)
+		else:
+			logging.debug("reusing profile files for: " + source_real_dir)
+
+		return fs_dict[source_real_dir]
+
+
+def readToml(file_path):
+	full_path = os.path.realpath(file_path)
+
+	with registry_lock:
+		if full_path not in toml_dict:
+			logging.debug("parsing profile file: " + full_path)
+			toml_file = open(full_path, "rb")
+			toml_dict[full_path] = tomllib.load(toml_file)
+			toml_file.close()
+
+		# Callers are free to modify what they get.
+		return copy.deepcopy(toml_dict[full_path])
+
+
+class Cache():
+	# Bump it when the cached data layout changes.
+	cache_format = 4
+
+	def __init__(self, source_dir):
+		cache_name = hashlib.sha256(source_dir.encode()).hexdigest() + Default.profile_cache_ext
+		self.cache_path = os.path.join(Default.getUserCacheDir(), Default.profile_cache_dir, cache_name)
+
+		self.cache_dict = self.read()
+
+	def getEmptyDict(self):
+		return {
+			"format": self.cache_format,
+			"walk": {},
+			"profile": {},
+		}
+
+	def read(self):
+		if not os.path.isfile(self.cache_path):
+			return self.getEmptyDict()
+
+		logging.debug("reading profile cache: " + self.cache_path)
+
+		try:
+			cache_file = open(self.cache_path, "r")
+			cache_dict = json.load(cache_file)
+			cache_file.close()
+		except (OSError, ValueError):
+			logging.debug("ignoring unreadable profile cache: " + self.cache_path)
+			return self.getEmptyDict()
+
+		if not isinstance(cache_dict, dict) or cache_dict.get("format") != self.cache_format:
+			logging.debug("ignoring outdated profile cache: " + self.cache_path)
+			return self.getEmptyDict()
+
+		return cache_dict
+
+	def write(self):
+		# Keys are not sorted, the order of profile dictionaries
+		# matters, for example file types of the same weight are
+		# tried in the order they are read.
+		try:
+			json_string = json.dumps(self.cache_dict)
+		except (TypeError, ValueError):
+			logging.debug("profile cannot be cached: " + self.cache_path)
+			return
+
+		cache_dir = os.path.dirname(self.cache_path)
+
+		try:
+			os.makedirs(cache_dir, exist_ok=True)
+
+			# Other Urcheon processes may read it at the same time.
+			temp_handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=Default.profile_cache_ext)
+			os.write(temp_handle, json_string.encode())
+			os.close(temp_handle)
+			os.replace(temp_path, self.cache_path)
+		except OSError:
+			logging.debug("cannot write profile cache: " + self.cache_path)
+
+	def getStamp(self, path):
+		try:
+			stat = os.stat(path)
+		except OSError:
+			return None
+
+		return [ stat.st_mtime_ns, stat.st_size ]
+
+	def getStampDict(self, path_list):
+		stamp_dict = {}
+
+		for path in path_list:
+			stamp_dict[path] = self.getStamp(path)
+
+		return stamp_dict
+
+	def isFresh(self, stamp_dict):
+		for path in stamp_dict.keys():
+			if self.getStamp(path) != stamp_dict[path]:
+				logging.debug("modified profile path: " + path)
+				return False
+
+		return True
+
+	def getWalk(self, root_list):
+		with registry_lock:
+			walk_dict = self.cache_dict["walk"]
+
+			if walk_dict.get("root_list") != root_list:
+				return None
+
+			if not self.isFresh(walk_dict["stamp_dict"]):
+				return None
+
+			return walk_dict["file_dict"]
+
+	def setWalk(self, root_list, dir_list, file_dict):
+		with registry_lock:
+			# Added or removed files may change the profile resolution.
+			if self.cache_dict["walk"].get("file_dict") != file_dict:
+				self.cache_dict["profile"] = {}
+
+			self.cache_dict["walk"] = {
+				"root_list": root_list,
+				"stamp_dict": self.getStampDict(root_list + dir_list),
+				"file_dict": file_dict,
+			}
+
+			self.write()
+
+	def getProfile(self, kind, name):
+		with registry_lock:
+			profile_key = kind + ":" + name
+
+			if profile_key not in self.cache_dict["profile"]:
+				return None
+
+			profile_dict = self.cache_dict["profile"][profile_key]
+
+			if not self.isFresh(profile_dict["stamp_dict"]):
+				return None
+
+			logging.debug("reusing cached " + kind + " profile: " + name)
+
+			# Callers are free to modify what they get.
+			return copy.deepcopy(profile_dict["value"])
+
+	def setProfile(self, kind, name, value, path_list):
+		with registry_lock:
+			profile_key = kind + ":" + name
+
+			self.cache_dict["profile"][profile_key] = {
+				"stamp_dict": self.getStampDict(path_list),
+				"value": copy.deepcopy(value),
+			}
+
+			self.write()
 
 
 class Fs():
 	def __init__(self, source_dir):
 		self.file_dict = {}
+		self.dir_list = []
 
-		profile_dir = os.path.join(Default.share_dir, Default.profile_dir)
-		self.walk(profile_dir)
+		self.cache = Cache(source_dir)
 
+		profile_dir = os.path.abspath(os.path.join(Default.share_dir, Default.profile_dir))
 		config_dir = Default.getPakConfigDir(source_dir)
-		self.walk(config_dir)
+		root_list = [ profile_dir, config_dir ]
+
+		cached_file_dict = self.cache.getWalk(root_list)
+
+		if cached_file_dict == None:
+			for dir_path in root_list:
+				self.walk(dir_path)
+
+			self.cache.setWalk(root_list, self.dir_list, self.file_dict)
+		else:
+			logging.debug("reusing cached profile file list for: " + source_dir)
+			self.file_dict = cached_file_dict
 
 		logging.debug("files found: " + str(self.file_dict))
 
 	def walk(self, dir_path):
 		full_dir_path = os.path.abspath(dir_path)
 		for dir_name, subdir_name_list, file_name_list in os.walk(full_dir_path):
+			self.dir_list.append(dir_name)
 			rel_dir_path = os.path.relpath(dir_name, full_dir_path)
 			for file_name in file_name_list:
 				rel_file_path = os.path.normpath(os.path.join(rel_dir_path, file_name))
@@ -45,6 +236,13 @@ class Fs():
 		else:
 			return None
 
+	# Merged profiles are cached with the list of files they are read from.
+	def getCachedProfile(self, kind, name):
+		return self.cache.getProfile(kind, name)
+
+	def setCachedProfile(self, kind, name, value, path_list):
+		self.cache.setProfile(kind, name, value, path_list)
+
 	def print(self):
 		for file_path in self.file_dict.keys():
 			print(file_path + " → " + self.file_dict[file_path])
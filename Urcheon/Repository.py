@@ -12,10 +12,12 @@ from Urcheon import Action
 from Urcheon import Default
 from Urcheon import FileSystem
 from Urcheon import Game
+from Urcheon import Parallelism
 from Urcheon import Profile
 from Urcheon import Ui
 from collections import OrderedDict
 from datetime import datetime
+import atexit
 import fnmatch
 import hashlib
 import json
@@ -26,6 +28,8 @@ import tomllib
 import re
 import shutil
 import subprocess
+import tempfile
+import threading
 import time
 
 
@@ -38,7 +42,7 @@ class Config():
 	def __init__(self, source_tree):
 		self.source_dir = source_tree.dir
 		self.base_name = source_tree.base_name
-		self.profile_fs = Profile.Fs(source_tree.dir)
+		self.profile_fs = Profile.getFs(source_tree.dir)
 
 		self.known_key_name_list = [ "type", "game", "name", "version" ]
 		self.known_pak_name_list = [ "dpk", "pk3", "pk4" ]
@@ -148,9 +152,7 @@ class Config():
 		logging.debug("reading pak config file " + config_file_path)
 
 		# FIXME: Catch error.
-		config_file = open(config_file_path, "rb")
-		config_dict = tomllib.load(config_file)
-		config_file.close()
+		config_dict = Profile.readToml(config_file_path)
 
 		if not "config" in config_dict.keys():
 			logging.debug("can't find config section in pak config file: " + config_file_path)
@@ -425,7 +427,7 @@ class FileProfile():
 		# because of: for self.inspector.inspector_name_dict
 		self.inspector = Inspector(None, None, None)
 
-		self.profile_fs = Profile.Fs(self.source_dir)
+		self.profile_fs = Profile.getFs(self.source_dir)
 
 		self.file_type_dict = {}
 		self.file_type_weight_dict = {}
@@ -436,8 +438,25 @@ class FileProfile():
 		else:
 			self.profile_name = self.game_name
 
-		self.readProfile(self.profile_name)
-		self.expandFileTypeDict()
+		# The same file profile name may extend different game profiles.
+		cached_profile_name = self.profile_name + ":" + self.game_name
+		cached_profile_dict = self.profile_fs.getCachedProfile("file", cached_profile_name)
+
+		if cached_profile_dict == None:
+			self.profile_path_list = []
+
+			self.readProfile(self.profile_name)
+			self.expandFileTypeDict()
+
+			profile_dict = {
+				"file_type": self.file_type_dict,
+				"file_type_weight": self.file_type_weight_dict,
+			}
+
+			self.profile_fs.setCachedProfile("file", cached_profile_name, profile_dict, self.profile_path_list)
+		else:
+			self.file_type_dict = cached_profile_dict["file_type"]
+			self.file_type_weight_dict = cached_profile_dict["file_type_weight"]
 
 	def getProfilePath(self, profile_name):
 		file_profile_name = os.path.join(Default.file_profile_dir, profile_name + Default.file_profile_ext)
@@ -450,9 +469,8 @@ class FileProfile():
 			# that's not a typo
 			Ui.error("file profile file not found: " + file_profile_path)
 
-		file_profile_file = open(file_profile_path, "rb")
-		file_profile_dict = tomllib.load(file_profile_file)
-		file_profile_file.close()
+		file_profile_dict = Profile.readToml(file_profile_path)
+		self.profile_path_list.append(file_profile_path)
 
 		if "_init_" in file_profile_dict.keys():
 			logging.debug("found “_init_” section in file profile: " + file_profile_path)
@@ -823,6 +841,11 @@ class Tree():
 
 		self.pak_vfs = PakVfs(source_dir)
 
+		# Set by the builder when requested.
+		self.use_git_object_id = False
+		self.git_object_id_dict = None
+		self.git_object_id_lock = threading.Lock()
+
 		if not is_nested:
 			self.pak_config = Config(self)
 			self.pak_format = self.pak_config.game_profile.pak_format
@@ -849,9 +872,26 @@ class Tree():
 
 		return file_list
 
+	def getGitObjectIdDict(self):
+		if not self.use_git_object_id:
+			return {}
+
+		# Read once per run, actions are running in threads.
+		with self.git_object_id_lock:
+			if self.git_object_id_dict == None:
+				file_repo = Git(self.dir, self.pak_format)
+
+				if file_repo.isGit():
+					self.git_object_id_dict = file_repo.getObjectIdDict()
+				else:
+					self.git_object_id_dict = {}
+
+		return self.git_object_id_dict
+
 
 class Paktrace():
 	def __init__(self, source_tree, build_dir):
+		self.source_tree = source_tree
 		self.source_dir = os.path.realpath(source_tree.dir)
 		self.build_dir = os.path.realpath(build_dir)
 
@@ -866,7 +906,7 @@ class Paktrace():
 
 	def readTraceDict(self, paktrace_path):
 		# FIXME: cache me
-		if os.path.isfile(paktrace_path):
+		if FileSystem.isFile(paktrace_path):
 			json_string = self.readTraceFile(paktrace_path)
 			try:
 				return json.loads(json_string)
@@ -905,7 +945,7 @@ class Paktrace():
 		return body
 
 	def getTimestampString(self, file_realpath):
-		return str(os.path.getmtime(file_realpath))
+		return str(FileSystem.getMtime(file_realpath))
 
 	def computeSha256sumString(self, file_realpath):
 		file_handler = open(file_realpath, "rb")
@@ -913,6 +953,11 @@ class Paktrace():
 		file_handler.close()
 		return hashlib.sha256(file_bytes).hexdigest()
 
+	def getGitObjectIdString(self, src):
+		# Only known for tracked files not modified in the working tree.
+		git_object_id_dict = self.source_tree.getGitObjectIdDict()
+		return git_object_id_dict.get(os.path.normpath(src))
+
 	def write(self, src, head, body):
 		logging.debug("write paktrace for head: " + head)
 
@@ -926,7 +971,6 @@ class Paktrace():
 		source_real_path = os.path.realpath(source_full_path)
 
 		source_timestamp = self.getTimestampString(source_real_path)
-		source_sha256sum = self.computeSha256sumString(source_real_path)
 
 		# TODO: Make sure files are in the same pakdir else error out.
 		source_real_dir = os.path.realpath(self.source_dir)
@@ -935,9 +979,17 @@ class Paktrace():
 		source_dict = {
 			"relpath": source_relpath,
 			"timestamp": source_timestamp,
-			"sha256sum": source_sha256sum
 		}
 
+		# Git already hashed the content of tracked unmodified files,
+		# only other files are hashed.
+		source_git_object_id = self.getGitObjectIdString(src)
+
+		if source_git_object_id:
+			source_dict["gitobject"] = source_git_object_id
+		else:
+			source_dict["sha256sum"] = self.computeSha256sumString(source_real_path)
+
 		json_dict = {}
 		json_dict["input"] = { src: source_dict }
 		json_dict["output"] = body
@@ -956,14 +1008,16 @@ class Paktrace():
 		head_path = os.path.join(self.build_dir, head)
 
 		shutil.copystat(head_path, paktrace_path)
+		FileSystem.invalidate(paktrace_path)
 
 	def remove(self, head, old_format=False):
 		logging.debug("remove paktrace for head: " + head)
 
 		paktrace_path = self.getPath(head, old_format=old_format)
 
-		if os.path.isfile(paktrace_path):
+		if FileSystem.isFile(paktrace_path):
 			os.remove(paktrace_path)
+			FileSystem.invalidate(paktrace_path)
 
 	def getName(self, head, old_format=False):
 		head_path = os.path.join(self.build_dir, head)
@@ -1046,11 +1100,11 @@ class Paktrace():
 
 		for source_path in source_dict.keys():
 			source_full_path = os.path.join(self.source_dir, source_path)
-			if not os.path.exists( source_full_path ):
+			if not FileSystem.exists(source_full_path):
 				return True;
 
 			# TODO: Make sure files are in the same pakdir else error out.
-			source_real_dir = os.path.realpath(self.source_dir)
+			source_real_dir = FileSystem.getRealPath(self.source_dir)
 			current_relpath = os.path.relpath(source_full_path, start=source_real_dir)
 
 			# Older versions of Urcheon were not writing the relpath key,
@@ -1066,12 +1120,33 @@ class Paktrace():
 				# do not test for sha256sum
 				continue
 
+			# Git already knows the content of tracked unmodified files,
+			# for example after a fresh clone restoring a build cache.
+			current_git_object_id = self.getGitObjectIdString(source_path)
+			if current_git_object_id and "gitobject" in source_dict[source_path].keys():
+				previous_git_object_id = source_dict[source_path]["gitobject"]
+				if (previous_git_object_id == current_git_object_id):
+					times = (-1, float(previous_timestamp))
+					os.utime(source_full_path, times)
+					os.utime(build_path, times)
+					FileSystem.invalidate(source_full_path)
+					FileSystem.invalidate(build_path)
+					continue
+				else:
+					return True
+
+			# Traces of files known by git may not have a sha256sum.
+			if "sha256sum" not in source_dict[source_path].keys():
+				return True
+
 			previous_sha256sum = source_dict[source_path]["sha256sum"]
 			current_sha256sum = self.computeSha256sumString(source_full_path)
 			if (previous_sha256sum == current_sha256sum):
 				times = (-1, float(previous_timestamp))
 				os.utime(source_full_path, times)
 				os.utime(build_path, times)
+				FileSystem.invalidate(source_full_path)
+				FileSystem.invalidate(build_path)
 				continue
 			else:
 				return True
@@ -1079,6 +1154,226 @@ class Paktrace():
 		return False
 
 
+# References do not move during a run, share what is known about them
+# between all the Git objects created for the same directory.
+git_cache_dict = {}
+git_cache_lock = threading.RLock()
+
+
+def getGitCache(source_dir):
+	source_dir = os.path.realpath(source_dir)
+
+	with git_cache_lock:
+		if source_dir not in git_cache_dict:
+			git_cache_dict[source_dir] = GitCache(source_dir)
+
+		return git_cache_dict[source_dir]
+
+
+class GitCache():
+	def __init__(self, source_dir):
+		self.source_dir = source_dir
+
+		self.is_git = None
+		self.commit_dict = {}
+		self.commit_list_dict = {}
+		self.version_tag_dict = None
+		self.version_tag_hash = None
+		self.version_dict = {}
+		self.modification_dict = {}
+		self.status = None
+
+		self.batch_proc = None
+		self.lock = threading.RLock()
+
+		self.committer_pattern = re.compile(r"^committer .* (?P<timestamp>[0-9]+) [+-][0-9]{4}$")
+
+	def resetStatus(self):
+		# Read the status again on next use.
+		with self.lock:
+			self.status = None
+
+	def startBatch(self):
+		logging.debug("start git object reader for: " + self.source_dir)
+		self.batch_proc = subprocess.Popen(["git", "-C", self.source_dir, "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		atexit.register(self.stopBatch)
+
+	def stopBatch(self):
+		with self.lock:
+			if self.batch_proc:
+				logging.debug("stop git object reader for: " + self.source_dir)
+				self.batch_proc.stdin.close()
+				self.batch_proc.wait()
+				self.batch_proc = None
+
+	def readCommit(self, reference):
+		# Returns the commit id and the committer date of the reference,
+		# reading the commit object from a single long-lived git process.
+		with self.lock:
+			if reference in self.commit_dict:
+				return self.commit_dict[reference]
+
+			if not self.batch_proc:
+				self.startBatch()
+
+			commit_id = None
+			commit_date = None
+
+			try:
+				self.batch_proc.stdin.write((reference + "^{commit}\n").encode())
+				self.batch_proc.stdin.flush()
+				header = self.batch_proc.stdout.readline().decode().split()
+			except BrokenPipeError:
+				header = []
+
+			# A missing or ambiguous object has no content.
+			if len(header) == 3 and header[1] == "commit":
+				commit_id = header[0]
+				content = self.batch_proc.stdout.read(int(header[2]) + 1).decode(errors="replace")
+
+				for line in content.splitlines():
+					if line == "":
+						break
+
+					committer_match = self.committer_pattern.match(line)
+					if committer_match:
+						commit_date = committer_match.group("timestamp")
+
+			self.commit_dict[reference] = (commit_id, commit_date)
+
+			return self.commit_dict[reference]
+
+
+class GitStatus():
+	def __init__(self, git_command):
+		# Paths are relative to the source directory.
+		self.modified_set = set()
+		self.untracked_list = []
+
+		proc = subprocess.Popen(git_command + ["rev-parse", "--show-prefix"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		stdout, stderr = proc.communicate()
+
+		prefix = stdout.decode().strip()
+
+		# Only look at the source directory, paths are printed
+		# relatively to the top level directory of the repository.
+		proc = subprocess.Popen(git_command + ["status", "--porcelain=v2", "-z", "--untracked-files=all", "--", "."], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		stdout, stderr = proc.communicate()
+
+		entry_list = stdout.decode().split('\0')[:-1]
+
+		entry_index = 0
+		while entry_index < len(entry_list):
+			entry = entry_list[entry_index]
+			entry_index += 1
+
+			entry_type = entry[0]
+
+			if entry_type == "1":
+				entry_field_list = entry.split(" ", 8)
+			elif entry_type == "2":
+				entry_field_list = entry.split(" ", 9)
+				# Original path of renamed or copied file.
+				entry_index += 1
+			elif entry_type == "u":
+				entry_field_list = entry.split(" ", 10)
+			elif entry_type == "?":
+				entry_field_list = entry.split(" ", 1)
+			else:
+				continue
+
+			file_path = entry_field_list[-1]
+
+			if file_path.startswith(prefix):
+				file_path = file_path[len(prefix):]
+
+			if entry_type == "?":
+				self.untracked_list.append(file_path)
+			elif entry_type == "u" or entry_field_list[1][1] != ".":
+				# Modified in the working tree.
+				self.modified_set.add(file_path)
+
+		logging.debug("git status: " + str(len(self.modified_set)) + " modified files, " + str(len(self.untracked_list)) + " untracked files")
+
+	def isDirty(self):
+		return len(self.modified_set) > 0 or len(self.untracked_list) > 0
+
+
+class VersionCache():
+	# Bump it when the version string computation changes.
+	cache_format = 2
+
+	# There is one cache file per source directory, overwritten
+	# when the key changes, so the cache doesn't grow with commits.
+	def __init__(self, source_dir, key_list):
+		name_string = json.dumps([self.cache_format, os.path.realpath(source_dir)])
+		cache_name = hashlib.sha256(name_string.encode()).hexdigest() + Default.version_cache_ext
+		self.cache_path = os.path.join(Default.getUserCacheDir(), Default.version_cache_dir, cache_name)
+		self.key_string = json.dumps([self.cache_format] + key_list)
+
+	def read(self):
+		if not os.path.isfile(self.cache_path):
+			return None
+
+		try:
+			cache_file = open(self.cache_path, "r")
+			cache_dict = json.load(cache_file)
+			cache_file.close()
+		except (OSError, ValueError):
+			logging.debug("ignoring unreadable version cache: " + self.cache_path)
+			return None
+
+		if not isinstance(cache_dict, dict) or cache_dict.get("key") != self.key_string:
+			logging.debug("ignoring mismatching version cache: " + self.cache_path)
+			return None
+
+		logging.debug("read version from cache: " + self.cache_path)
+		return cache_dict.get("version")
+
+	def write(self, version):
+		json_string = json.dumps({"key": self.key_string, "version": version}, sort_keys=True)
+
+		cache_dir = os.path.dirname(self.cache_path)
+
+		try:
+			os.makedirs(cache_dir, exist_ok=True)
+
+			# Other Urcheon processes may read it at the same time.
+			temp_handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=Default.version_cache_ext)
+			os.write(temp_handle, json_string.encode())
+			os.close(temp_handle)
+			os.replace(temp_path, self.cache_path)
+		except OSError:
+			logging.debug("cannot write version cache: " + self.cache_path)
+			return
+
+		self.removeLegacyFiles()
+
+	def removeLegacyFiles(self):
+		# Older formats wrote one file per key.
+		cache_dir = os.path.dirname(self.cache_path)
+
+		for file_name in os.listdir(cache_dir):
+			if not file_name.endswith(Default.version_cache_ext):
+				continue
+
+			file_path = os.path.join(cache_dir, file_name)
+
+			try:
+				cache_file = open(file_path, "r")
+				cache_dict = json.load(cache_file)
+				cache_file.close()
+
+				if json.loads(cache_dict["key"])[0] >= self.cache_format:
+					continue
+
+				logging.debug("removing legacy version cache: " + file_path)
+				os.remove(file_path)
+			except (OSError, ValueError, KeyError, IndexError, TypeError):
+				# Being written by another process, or not ours.
+				continue
+
+
 class Git():
 	def __init__(self, source_dir, pak_format, workaround_no_delete=False):
 		self.source_dir = source_dir
@@ -1090,25 +1385,60 @@ class Git():
 		self.subprocess_stderr = subprocess.DEVNULL
 
 		self.version_tag_pattern = re.compile(r"^v[0-9].*")
+		self.commit_id_pattern = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+		self.cache = getGitCache(self.source_dir)
 
 		# TODO: add a command-line option
 		env_timestamp_hex = os.getenv("URCHEON_TIMESTAMP_HEX")
 		if env_timestamp_hex:
 			self.timestamp_function = self.getHexTimeStamp
+			self.timestamp_mode = "hex"
 		else:
 			self.timestamp_function = self.getCompactHumanTimeStamp
+			self.timestamp_mode = "human"
 
 	def isGit(self):
-		proc = subprocess.call(self.git + ["rev-parse"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-		return proc.numerator == 0
+		if self.cache.is_git == None:
+			proc = subprocess.call(self.git + ["rev-parse"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+			self.cache.is_git = proc.numerator == 0
+
+		return self.cache.is_git
 
 	def getVersion(self, version_suffix=None):
+		commit_id = self.getCommit("HEAD")
+		is_dirty = self.isDirty()
+
+		# Without commit the version is made of current time.
+		if commit_id == None:
+			return self.buildVersion(version_suffix, is_dirty)
+
+		self.getVersionTagDict()
+
+		key_list = [ commit_id, self.cache.version_tag_hash, is_dirty, version_suffix, self.timestamp_mode ]
+		version_key = json.dumps(key_list)
+
+		if version_key in self.cache.version_dict:
+			return self.cache.version_dict[version_key]
+
+		version_cache = VersionCache(self.source_dir, key_list)
+		version = version_cache.read()
+
+		if version == None:
+			version = self.buildVersion(version_suffix, is_dirty)
+			version_cache.write(version)
+
+		self.cache.version_dict[version_key] = version
+
+		return version
+
+	def buildVersion(self, version_suffix, is_dirty):
 		version = self.computeVersion("HEAD")
 
 		if version_suffix:
 			version += version_suffix
 
-		if self.isDirty():
+		if is_dirty:
 			version += "+dirty"
 
 		return version
@@ -1195,6 +1525,12 @@ class Git():
 		# the git call would print some tag related info and then the test will
 		# always be true and then produce a false positive.
 
+		# The list of tested changes depends on the pak format.
+		modification_key = (reference, self.pak_format == "dpk" and not self.workaround_no_delete)
+
+		if modification_key in self.cache.modification_dict:
+			return self.cache.modification_dict[modification_key]
+
 		# Unvanquished game did not supported DELETED file until after to 0.52.1.
 		if (self.pak_format == "dpk" and not self.workaround_no_delete):
 			# Test for ACMD: Added, Copied, Modified, Deleted
@@ -1213,59 +1549,64 @@ class Git():
 		file_list = stdout.decode().splitlines()
 		logging.debug("modified file list: " + str(file_list))
 
-		return len(file_list) != 0
+		self.cache.modification_dict[modification_key] = len(file_list) != 0
 
-	def isDirty(self):
-		proc = subprocess.call(self.git + ["diff", "--quiet"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		return self.cache.modification_dict[modification_key]
 
-		# modified file
-		if proc.numerator != 0:
-			# Ignore modified file outside the dpkdir (when the dpkdir is a subfolder of a repository)
+	def getStatus(self):
+		# The status is read once and shared by all the Git objects
+		# of the source directory, this assumes nothing but the
+		# prepare stage writes in the source directory during a run,
+		# the prepare stage resets the status when done.
+		with self.cache.lock:
+			if self.cache.status == None:
+				self.cache.status = GitStatus(self.git)
 
-			# TODO: Add an option to force those files to marke the package as dirty.
-			# Some files may be contributed to the final package with --merge-directory
-			# like binaries built from sources files from the same repository.
+			return self.cache.status
 
-			proc = subprocess.Popen(self.git + ["rev-parse", "--show-toplevel"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-			stdout, stderr = proc.communicate()
+	def isDirty(self):
+		# Modified and untracked files in the pakdir make it dirty,
+		# modified files outside the pakdir (when the pakdir is a
+		# subfolder of a repository) are ignored.
 
-			if proc.returncode != 0:
-				Ui.error("Something bad happened with pakdir " + self.source_dir, silent=True)
+		# TODO: Add an option to force those files to marke the package as dirty.
+		# Some files may be contributed to the final package with --merge-directory
+		# like binaries built from sources files from the same repository.
+		return self.getStatus().isDirty()
 
-			toplevel_path = stdout.decode().splitlines()[0]
+	def getDeletedFileList(self, reference):
+		proc = subprocess.Popen(self.git + ["diff", "--diff-filter=D", "--no-renames", "--pretty=format:", "--name-only", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		stdout, stderr = proc.communicate()
 
-			proc = subprocess.Popen(self.git + ["diff", "-z", "--name-only"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-			stdout, stderr = proc.communicate()
+		file_list = stdout.decode().splitlines()
 
-			file_list = [x for x in stdout.decode().split('\0')[:-1]]
+		return file_list
 
-			source_dir_fullpath = os.path.realpath(self.source_dir)
-			for file_path in file_list:
-				full_path = os.path.realpath(os.path.join(toplevel_path, file_path))
-				if not os.path.relpath(source_dir_fullpath, full_path).startswith(".."):
-					return True
+	def getObjectIdDict(self):
+		# Tracked files that are not modified in the working tree have
+		# the content of the object recorded in the index.
+		proc = subprocess.Popen(self.git + ["ls-files", "-z", "--stage"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		stdout, stderr = proc.communicate()
 
-			# TODO: Add an option for ignoring changes in submodules of the dpkdir.
-			# The chance someone does that is very little anyway.
-			# We may want this if we want files modified outside of dpkdir to
-			# make the package dirty if binary merged to the packages are built
-			# from the same repository but outside the dpkdir.
+		object_id_dict = {}
 
-		proc = subprocess.Popen(self.git + ["ls-files", "-z", "--others", "--exclude-standard"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-		stdout, stderr = proc.communicate()
+		for line in stdout.decode().split('\0')[:-1]:
+			file_info, file_path = line.split("\t", 1)
+			file_mode, object_id, file_stage = file_info.split(" ")
 
-		file_list = stdout.decode().split('\0')[:-1]
+			# Skip unmerged files, symbolic links and submodules.
+			if file_stage != "0" or file_mode not in ["100644", "100755"]:
+				continue
 
-		# added file
-		return len(file_list) > 0
+			object_id_dict[file_path] = object_id
 
-	def getDeletedFileList(self, reference):
-		proc = subprocess.Popen(self.git + ["diff", "--diff-filter=D", "--no-renames", "--pretty=format:", "--name-only", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-		stdout, stderr = proc.communicate()
+		for file_path in self.getStatus().modified_set:
+			if file_path in object_id_dict:
+				del object_id_dict[file_path]
 
-		file_list = stdout.decode().splitlines()
+		logging.debug("found " + str(len(object_id_dict)) + " git objects for unmodified files in: " + self.source_dir)
 
-		return file_list
+		return object_id_dict
 
 	def getHexTimeStamp(self, commit_date):
 		time_stamp = "0" + hex(int(commit_date))[2:]
@@ -1276,6 +1617,9 @@ class Git():
 		return time_stamp
 
 	def getCommitList(self, reference):
+		if reference in self.cache.commit_list_dict:
+			return self.cache.commit_list_dict[reference]
+
 		# more recent first
 		# repository without commit displays an error on stderr we silent
 		proc = subprocess.Popen(self.git + ["rev-list", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
@@ -1283,29 +1627,53 @@ class Git():
 
 		commit_list = stdout.decode().splitlines()
 
-		if len(commit_list) > 0:
-			return commit_list
-		else:
-			return []
+		self.cache.commit_list_dict[reference] = commit_list
+
+		return commit_list
 
 	def getCommit(self, reference):
-		# repository without commit displays an error on stderr we silent
-		proc = subprocess.Popen(self.git + ["rev-list", "-n", "1", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		# repository without commit has no commit to read
+		commit_id, commit_date = self.cache.readCommit(reference)
+		return commit_id
+
+	def getVersionTagDict(self):
+		# List all version tags at once instead of asking for the tags
+		# of every commit of the history.
+		if self.cache.version_tag_dict != None:
+			return self.cache.version_tag_dict
+
+		# smaller first
+		# %(*objectname) is the commit pointed by an annotated tag.
+		proc = subprocess.Popen(self.git + ["for-each-ref", "--sort=version:refname", "--format=%(objectname) %(*objectname) %(refname:strip=2)", "refs/tags/v[0-9]*"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
 		stdout, stderr = proc.communicate()
 
-		commit_list = stdout.decode().splitlines()
+		version_tag_dict = {}
 
-		if len(commit_list) > 0:
-			return commit_list[0]
-		else:
-			return None
+		# Any tag change may change computed versions.
+		self.cache.version_tag_hash = hashlib.sha256(stdout).hexdigest()
+
+		for line in stdout.decode().splitlines():
+			object_id, commit_id, tag_name = line.split(" ", 2)
+
+			if commit_id == "":
+				commit_id = object_id
+
+			if commit_id not in version_tag_dict:
+				version_tag_dict[commit_id] = []
+
+			version_tag_dict[commit_id].append(tag_name)
+
+		logging.debug("version tags: " + str(version_tag_dict))
+
+		self.cache.version_tag_dict = version_tag_dict
+
+		return self.cache.version_tag_dict
 
 	def getVersionTag(self, reference):
-		# smaller first
-		proc = subprocess.Popen(self.git + ["tag", "--points-at", reference, "--sort=version:refname", "v[0-9]*"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-		stdout, stderr = proc.communicate()
+		if not self.commit_id_pattern.match(reference):
+			reference = self.getCommit(reference)
 
-		tag_list = stdout.decode().splitlines()
+		tag_list = self.getVersionTagDict().get(reference, [])
 
 		if len(tag_list) > 0:
 			# If there are more than one tag we should use
@@ -1357,12 +1725,10 @@ class Git():
 		return self.getCommit(reference)[:7]
 
 	def getDate(self, reference):
-		proc = subprocess.Popen(self.git + ["log", "-1", "--pretty=format:%ct", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-		stdout, stderr = proc.communicate()
-		lines = stdout.decode().splitlines()
-		if len(lines) == 0:
+		commit_id, commit_date = self.cache.readCommit(reference)
+		if commit_date == None:
 			return 0
-		return stdout.decode().splitlines()[0]
+		return commit_date
 
 	def listFiles(self):
 		proc = subprocess.Popen(self.git + ["ls-files"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
@@ -1375,9 +1741,7 @@ class Git():
 		return file_list
 
 	def listUntrackedFiles(self):
-		proc = subprocess.Popen(self.git + ["ls-files", "--others", "--exclude-standard"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-		stdout, stderr = proc.communicate()
-		file_list = stdout.decode().splitlines()
+		file_list = list(self.getStatus().untracked_list)
 
 		blacklist = BlackList(self.source_dir, self.pak_format)
 		file_list = blacklist.filter(file_list)
@@ -1386,9 +1750,9 @@ class Git():
 
 	def listFilesSinceReference(self, reference):
 		file_list = []
-		proc = subprocess.Popen(self.git + ["diff", "--name-only", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		proc = subprocess.Popen(self.git + ["diff", "-z", "--name-only", reference], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
 		stdout, stderr = proc.communicate()
-		repo_file_list = stdout.decode().splitlines()
+		repo_file_list = stdout.decode().split('\0')[:-1]
 
 		for file_path in repo_file_list:
 			full_path = os.path.join(self.source_dir, file_path)
@@ -1406,9 +1770,13 @@ class Git():
 		return file_list
 
 class Deleted():
+	# The source tree can be None when only reading and
+	# producing lists, for example from archives.
 	def __init__(self, source_tree, test_dir, stage_name):
 		self.source_tree = source_tree
-		self.source_dir = source_tree.dir
+		self.source_dir = None
+		if source_tree:
+			self.source_dir = source_tree.dir
 		self.test_dir = test_dir
 		self.stage_name = stage_name
 		self.deleted_file_list = []
@@ -1429,9 +1797,14 @@ class Deleted():
 			return False
 
 		deleted_file = open(deleted_file_path, "r")
-		line_list = [line.strip() for line in deleted_file]
+		self.parse(deleted_file.read())
 		deleted_file.close()
 
+		return True
+
+	def parse(self, string):
+		line_list = [line.strip() for line in string.splitlines()]
+
 		empty_line_pattern = re.compile(r"^[ \t]*$")
 		deleted_line_pattern = re.compile(r"^[ \t]*(?P<pak_name>[^ \t]*)[ \t]*(?P<file_path>.*)$")
 
@@ -1449,8 +1822,6 @@ class Deleted():
 
 			Ui.error("malformed line in DELETED file: " + line)
 
-		return True
-
 	def getActions(self):
 		if not self.read():
 			return []
@@ -1532,6 +1903,15 @@ class Deleted():
 
 		return self.deleted_part_list
 
+	def setPart(self, pak_name, file_path):
+		deleted_part_dict = {
+			"pak_name": pak_name,
+			"file_path": file_path,
+		}
+
+		if deleted_part_dict not in self.deleted_part_list:
+			self.deleted_part_list.append(deleted_part_dict)
+
 	def removePart(self, pak_name, file_path):
 		deleted_part_dict = {
 			"pak_name": pak_name,
@@ -1547,9 +1927,13 @@ class Deleted():
 
 
 class Deps():
+	# The source tree can be None when only reading and
+	# producing lists, for example from archives.
 	def __init__(self, source_tree, test_dir):
 		self.deps_dict = OrderedDict()
-		self.source_dir = source_tree.dir
+		self.source_dir = None
+		if source_tree:
+			self.source_dir = source_tree.dir
 		self.test_dir = test_dir
 
 	def get_source_path(self, deps_dir):
@@ -1575,9 +1959,14 @@ class Deps():
 			return False
 
 		deps_file = open(deps_file_path, "r")
-		line_list = [line.strip() for line in deps_file]
+		self.parse(deps_file.read())
 		deps_file.close()
 
+		return True
+
+	def parse(self, string):
+		line_list = [line.strip() for line in string.splitlines()]
+
 		empty_line_pattern = re.compile(r"^[ \t]*$")
 		basic_deps_line_pattern = re.compile(r"^[ \t]*(?P<pak_name>[^ \t]*)[ \t]*$")
 		version_deps_line_pattern = re.compile(r"^[ \t]*(?P<pak_name>[^ \t]*)[ \t]*(?P<pak_version>.*)$")
@@ -1603,8 +1992,6 @@ class Deps():
 
 			Ui.error("malformed line in DEPS file: " + line)
 
-		return True
-
 	def translateTest(self):
 		Ui.laconic("translating DEPS for testing")
 		for pak_name in self.deps_dict.keys():
@@ -1617,6 +2004,14 @@ class Deps():
 
 	def translateRelease(self, pakpath):
 		Ui.laconic("translating DEPS for release")
+
+		test_pak_name_list = []
+		for pak_name in self.deps_dict.keys():
+			if self.get(pak_name) == "test":
+				test_pak_name_list.append(pak_name)
+
+		pakpath.resolvePakDirVersions(test_pak_name_list)
+
 		for pak_name in self.deps_dict.keys():
 			pak_version = self.get(pak_name)
 
@@ -1670,6 +2065,118 @@ class Deps():
 			os.remove(deps_file_path)
 
 
+# Pakpaths are scanned once per process and shared by all the trees,
+# including nested ones.
+pak_index_dict = {}
+pak_index_lock = threading.RLock()
+
+
+def getPakIndex(pakpath_list):
+	pakpath_key = tuple(pakpath_list)
+
+	with pak_index_lock:
+		if pakpath_key not in pak_index_dict:
+			pak_index_dict[pakpath_key] = PakIndex(pakpath_list)
+
+		return pak_index_dict[pakpath_key]
+
+
+class PakIndex():
+	def __init__(self, pakpath_list):
+		self.pakpath_list = pakpath_list
+		self.lock = threading.RLock()
+
+		self.scan()
+
+	def scan(self):
+		pakdir_dict = {}
+		pak_dict = {}
+
+		# HACK: Only support dpkdir and dpk for now.
+		dpkdir_ext = ".dpkdir"
+		dpk_ext = ".dpk"
+
+		for pakpath in self.pakpath_list:
+			try:
+				dir_entry_list = list(os.scandir(pakpath))
+			except OSError:
+				logging.debug("cannot list pakpath: " + pakpath)
+				continue
+
+			for dir_entry in dir_entry_list:
+				dir_name = dir_entry.name
+				full_path = os.path.abspath(dir_entry.path)
+
+				if dir_name.endswith(dpkdir_ext) and dir_entry.is_dir():
+					# FIXME: Handle properly multiple dpkdir with same name
+					# in multiple pakpaths.
+					pak_name = dir_name.split('_')[0]
+					pak_version = dir_name.split('_')[1][:-len(dpkdir_ext)]
+
+					logging.debug("found version for pakdir “" + dir_name + "”: " + pak_version)
+
+					pakdir_dict[pak_name] = {}
+					pakdir_dict[pak_name]["full_path"] = full_path
+					pakdir_dict[pak_name]["version"] = pak_version
+
+				elif dir_name.endswith(dpk_ext) and "_" in dir_name and dir_entry.is_file():
+					pak_name = dir_name.split('_')[0]
+					pak_version = dir_name[len(pak_name) + 1:-len(dpk_ext)]
+
+					logging.debug("found version for pak “" + dir_name + "”: " + pak_version)
+
+					pak_dict[pak_name] = {}
+					pak_dict[pak_name]["full_path"] = full_path
+					pak_dict[pak_name]["version"] = pak_version
+
+		# Paks only provide names for which there is no pakdir.
+		for pak_name in pak_dict.keys():
+			if pak_name not in pakdir_dict:
+				pakdir_dict[pak_name] = pak_dict[pak_name]
+
+		with self.lock:
+			self.pakdir_dict = pakdir_dict
+			self.version_dict = {}
+
+	def getVersion(self, pak_name):
+		with self.lock:
+			if pak_name in self.version_dict:
+				return self.version_dict[pak_name]
+
+			if pak_name not in self.pakdir_dict:
+				return None
+
+			pakdir_entry = self.pakdir_dict[pak_name]
+
+		pak_version = pakdir_entry["version"]
+
+		if pak_version == "src":
+			git = Git(pakdir_entry["full_path"], "dpk")
+			pak_version = git.getVersion()
+
+		with self.lock:
+			self.version_dict[pak_name] = pak_version
+
+		return pak_version
+
+	def resolveVersions(self, pak_name_list):
+		# Computing versions from git history is done in parallel.
+		thread_list = []
+
+		for pak_name in pak_name_list:
+			with self.lock:
+				if pak_name in self.version_dict or pak_name not in self.pakdir_dict:
+					continue
+
+				if self.pakdir_dict[pak_name]["version"] != "src":
+					continue
+
+			thread = Parallelism.Thread(target=self.getVersion, args=(pak_name,))
+			thread_list.append(thread)
+
+		Parallelism.joinThreads(thread_list)
+
+
 class PakVfs:
 	def __init__(self, source_dir):
 		self.pakpath_list = []
@@ -1694,48 +2201,27 @@ class PakVfs:
 
 			Ui.notice("PAKPATH set, will use: " + separator.join(self.pakpath_list))
 
-		self.pakdir_dict = {}
-
-		for pakpath in self.pakpath_list:
-			for dir_name in os.listdir(pakpath):
-				full_path = os.path.abspath(os.path.join(pakpath, dir_name))
-
-				if os.path.isdir(full_path):
-					# HACK: Only support dpkdir for now.
-					dpkdir_ext = ".dpkdir"
-
-					if dir_name.endswith(dpkdir_ext):
-						# FIXME: Handle properly multiple dpkdir with same name
-						# in multiple pakpaths.
-
-						if dir_name not in self.pakdir_dict:
-							pak_name = dir_name.split('_')[0]
-							pak_version = dir_name.split('_')[1][:-len(dpkdir_ext)]
-
-							logging.debug("found version for pakdir “" + dir_name + "”: " + pak_version)
+		self.pak_index = getPakIndex(self.pakpath_list)
 
-							self.pakdir_dict[pak_name] = {}
-							self.pakdir_dict[pak_name]["full_path"] = full_path
-							self.pakdir_dict[pak_name]["version"] = pak_version
+	def refresh(self):
+		self.pak_index.scan()
 
 	def listPakPath(self):
 		return self.pakpath_list
 
 	def listPakDir(self):
-		return self.pakdir_dict
+		return self.pak_index.pakdir_dict
+
+	def resolvePakDirVersions(self, pak_name_list):
+		self.pak_index.resolveVersions(pak_name_list)
 
 	def getPakDirVersion(self, pak_name):
-		if pak_name not in self.pakdir_dict:
+		pak_version = self.pak_index.getVersion(pak_name)
+
+		if pak_version == None:
 			Ui.warning("missing pakdir, can't enforce version: " + pak_name)
 			return None
 
-		pak_version = self.pakdir_dict[pak_name]["version"]
-
-		if pak_version == "src":
-			full_path = self.pakdir_dict[pak_name]["full_path"]
-			git = Git(full_path, "dpk")
-			pak_version = git.getVersion()
-
 		logging.debug("found version for pak “" + pak_name + "”: " + pak_version)
 
 		return pak_version
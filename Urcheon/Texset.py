@@ -29,17 +29,22 @@ class PrevRun():
 		self.game_name = source_tree.game_name
 
 		self.source_dir_fullpath = os.path.realpath(self.source_dir)
-		preview_profile_fullpath = os.path.join(self.source_dir_fullpath, preview_profile_path)
 
-		self.profile_fs = Profile.Fs(self.source_dir)
+		self.profile_fs = Profile.getFs(self.source_dir)
 		self.prevrun_dict = {}
 
-		self.read(preview_profile_path, real_path = True)
+		# The same prevrun file may extend different game profiles.
+		cached_profile_name = os.path.realpath(os.path.join(self.source_dir, preview_profile_path)) + ":" + str(self.game_name)
+		cached_profile_dict = self.profile_fs.getCachedProfile("prevrun", cached_profile_name)
 
-		logging.debug("reading preview profile file: " + preview_profile_fullpath)
-		preview_profile_file = open(preview_profile_fullpath, "rb")
-		prevrun_dict = tomllib.load(preview_profile_file)
-		preview_profile_file.close()
+		if cached_profile_dict == None:
+			self.profile_path_list = []
+
+			self.read(preview_profile_path, real_path = True)
+
+			self.profile_fs.setCachedProfile("prevrun", cached_profile_name, self.prevrun_dict, self.profile_path_list)
+		else:
+			self.prevrun_dict = cached_profile_dict
 
 		if "dir" not in self.prevrun_dict.keys():
 			Ui.error("missing config section: dir")
@@ -102,9 +107,8 @@ class PrevRun():
 			Ui.error("prevrun profile file not found: " + prevrun_profile_fullpath)
 
 		logging.debug("reading prevrun profile file: " + prevrun_profile_fullpath)
-		prevrun_profile_file = open(prevrun_profile_fullpath, "rb")
-		prevrun_dict = tomllib.load(prevrun_profile_file)
-		prevrun_profile_file.close()
+		prevrun_dict = Profile.readToml(prevrun_profile_fullpath)
+		self.profile_path_list.append(prevrun_profile_fullpath)
 
 		if "_init_" in prevrun_dict.keys():
 			logging.debug("found “_init_” section in prevrun profile file: " + prevrun_profile_fullpath)
@@ -238,10 +242,21 @@ class SlothRun():
 
 		self.slothrun_file_path = os.path.normpath(os.path.relpath(slothrun_file_path, self.source_dir))
 
-		self.profile_fs = Profile.Fs(self.source_dir)
+		self.profile_fs = Profile.getFs(self.source_dir)
 		self.slothrun_dict = {}
 
-		self.read(self.slothrun_file_path, real_path=True)
+		# The same slothrun file may extend different game profiles.
+		cached_profile_name = os.path.realpath(os.path.join(self.source_dir, self.slothrun_file_path)) + ":" + str(self.game_name)
+		cached_profile_dict = self.profile_fs.getCachedProfile("slothrun", cached_profile_name)
+
+		if cached_profile_dict == None:
+			self.profile_path_list = []
+
+			self.read(self.slothrun_file_path, real_path=True)
+
+			self.profile_fs.setCachedProfile("slothrun", cached_profile_name, self.slothrun_dict, self.profile_path_list)
+		else:
+			self.slothrun_dict = cached_profile_dict
 
 		self.texture_source_dir_list = None
 
@@ -322,9 +337,8 @@ class SlothRun():
 			Ui.error("slothrun profile file not found: " + slothrun_profile_fullpath)
 
 		logging.debug("reading slothrun profile file: " + slothrun_profile_fullpath)
-		slothrun_profile_file = open(slothrun_profile_fullpath, "rb")
-		slothrun_dict = tomllib.load(slothrun_profile_file)
-		slothrun_profile_file.close()
+		slothrun_dict = Profile.readToml(slothrun_profile_fullpath)
+		self.profile_path_list.append(slothrun_profile_fullpath)
 
 		if "_init_" in slothrun_dict.keys():
 			logging.debug("found “_init_” section in slothrun profile file: " + slothrun_profile_fullpath)
@@ -9,8 +9,9 @@
 
 
 import sys
-from colorama import Fore, Style, init
 
+# The colorama module is only imported when printing to a terminal
+# since importing it is slow and most scripted calls don't need it.
 
 # keep an eye on the default Python's print function
 _print = print
@@ -19,18 +20,21 @@ verbosity = None
 
 def laconic(message):
 	if sys.stdout.isatty():
+		from colorama import Fore, Style
 		message = Fore.GREEN + message + Style.RESET_ALL
 	_print(message)
 
 def print(message):
 	if verbosity != "laconic":
 		if sys.stdout.isatty():
+			from colorama import Fore, Style
 			message = Fore.GREEN + message + Style.RESET_ALL
 		_print(message)
 
 def verbose(message):
 	if verbosity == verbose:
 		if sys.stdout.isatty():
+			from colorama import Fore, Style
 			message = Style.DIM + message + Style.RESET_ALL
 
 		_print(message)
@@ -39,6 +43,7 @@ def warning(message):
 	message = "Warning: " + message
 
 	if sys.stdout.isatty():
+		from colorama import Fore, Style
 		message = Fore.YELLOW + message + Style.RESET_ALL
 
 	_print(message)
@@ -47,6 +52,7 @@ def help(message, exit=False):
 	message = "Help: " + message
 
 	if sys.stdout.isatty():
+		from colorama import Fore, Style
 		message = Fore.MAGENTA + message + Style.RESET_ALL
 
 	_print(message)
@@ -58,6 +64,7 @@ def notice(message):
 	message = "Notice: " + message
 
 	if sys.stdout.isatty():
+		from colorama import Fore, Style
 		message = Fore.CYAN + message + Style.RESET_ALL
 
 	_print(message)
@@ -67,6 +74,7 @@ def error(message, silent=False, exit=True):
 	message = "Error: " + message
 
 	if sys.stdout.isatty():
+		from colorama import Fore, Style
 		message = Fore.RED + message + Style.RESET_ALL
 	_print(message)
 
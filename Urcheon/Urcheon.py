@@ -8,17 +8,20 @@
 #
 
 
-from Urcheon import Action
 from Urcheon import Default
-from Urcheon import Pak
-from Urcheon import Repository
 from Urcheon import Ui
 import argparse
 import logging
 import os
 import sys
 
+# Action, Pak and Repository modules are imported by commands needing
+# them, importing them is slow and not every command needs all of them.
+
 def discover(args):
+	from Urcheon import Action
+	from Urcheon import Repository
+
 	source_dir_list = args.source_dir
 
 	for source_dir in source_dir_list:
@@ -34,6 +37,8 @@ def discover(args):
 		action_list.updateActions(action_list)
 
 def prepare(args):
+	from Urcheon import Pak
+
 	args.__dict__.update(stage_name="prepare")
 
 	source_dir_list = args.source_dir
@@ -43,6 +48,8 @@ def prepare(args):
 	multi_runner.run()
 
 def build(args):
+	from Urcheon import Pak
+
 	args.__dict__.update(stage_name="build")
 
 	source_dir_list = args.source_dir
@@ -54,6 +61,8 @@ def build(args):
 	multi_runner.run()
 
 def package(args):
+	from Urcheon import Pak
+
 	args.__dict__.update(stage_name="package")
 
 	source_dir_list = args.source_dir
@@ -71,7 +80,37 @@ def package(args):
 	multi_runner = Pak.MultiRunner(source_dir_list, args)
 	multi_runner.run()
 
+def verify(args):
+	from Urcheon import Pak
+
+	if args.compare_pak_list:
+		comparator = Pak.Comparator(*args.compare_pak_list)
+		comparator.run()
+		return
+
+	args.__dict__.update(stage_name="verify")
+
+	source_dir_list = args.source_dir
+
+	if args.test_dir and len(source_dir_list) > 1:
+		Ui.error("--pakdir can't be used while verifying more than one source directory", silent=True)
+
+	if args.pak_file and len(source_dir_list) > 1:
+		Ui.error("--pak can't be used while verifying more than one source directory", silent=True)
+
+	multi_runner = Pak.MultiRunner(source_dir_list, args)
+	multi_runner.run()
+
+def delta(args):
+	from Urcheon import Pak
+
+	delta = Pak.Delta(args.old_pak_file, args.new_pak_file, args.delta_pak_file)
+	delta.run()
+
 def clean(args):
+	from Urcheon import Pak
+	from Urcheon import Repository
+
 	clean_all = args.clean_all
 
 	if not args.clean_source \
@@ -155,6 +194,7 @@ def main():
 
 	prepare_parser.add_argument("-n", "--no-auto-actions", dest="no_auto_actions", help="do not compute actions at build time", action="store_true")
 	prepare_parser.add_argument("-k", "--keep", dest="keep_dust", help="keep dust from previous build", action="store_true")
+	prepare_parser.add_argument("-go", "--git-object-id", dest="git_object_id", help="use git object ids to detect unmodified tracked files", action="store_true")
 	prepare_parser.add_argument("source_dir", nargs="*", metavar="DIRNAME", default=".", help="prepare %(metavar)s directory, default: %(default)s")
 
 	# Build
@@ -164,7 +204,11 @@ def main():
 	build_parser.add_argument("-mp", "--map-profile", dest="map_profile", metavar="PROFILE", help="build map with %(metavar)s profile, default: %(default)s")
 	build_parser.add_argument("-n", "--no-auto", dest="no_auto_actions", help="do not compute actions", action="store_true")
 	build_parser.add_argument("-k", "--keep", dest="keep_dust", help="keep dust from previous build", action="store_true")
+	build_parser.add_argument("-go", "--git-object-id", dest="git_object_id", help="use git object ids to detect unmodified tracked files", action="store_true")
 	build_parser.add_argument("-cm", "--clean-map", dest="clean_map", help="clean previous map build", action="store_true")
+	build_parser.add_argument("-pd", "--pre-deflate", dest="pre_deflate", help="deflate built files in the build cache to speed-up packaging", action="store_true")
+	build_parser.add_argument("-we", "--webp-encoder", dest="webp_encoder", metavar="ENCODER", choices=["cwebp", "pillow"], default="cwebp", help="encode lossless webp with %(metavar)s: cwebp or pillow (in-process, lossy webp is always encoded with cwebp), default: %(default)s")
+	build_parser.add_argument("--image-cache-size", dest="image_cache_size", metavar="MIB", type=int, default=Default.image_cache_size, help="keep up to %(metavar)s mebibytes of decoded images for sources converted more than once, default: %(default)s")
 	build_parser.add_argument("-r", "--reference", dest="since_reference", metavar="REFERENCE", help="build partial pakdir since given reference")
 	build_parser.add_argument("source_dir", nargs="*", metavar="DIRNAME", default=".", help="build from %(metavar)s directory, default: %(default)s")
 
@@ -173,10 +217,30 @@ def main():
 	package_parser.set_defaults(func=package)
 
 	package_parser.add_argument("-ad", "--allow-dirty", dest="allow_dirty", help="allow to package from repositories with uncommitted files", action="store_true")
-	package_parser.add_argument("-nc", "--no-compress", dest="no_compress", help="package without compression", action="store_true")
-	package_parser.add_argument("--merge-directory", dest="merge_dir", metavar="DIRNAME", help="add files from the directory to the archive")
+	package_parser.add_argument("-nc", "--no-compress", dest="no_compress", help="package without compression (store files)", action="store_true")
+	package_parser.add_argument("--merge-directory", dest="merge_dir", metavar="DIRNAME", help="add files from the directory or the dpk or pk3 archive to the archive")
+	package_parser.add_argument("--previous-pak", dest="previous_pak", metavar="FILENAME", help="reuse compressed files from %(metavar)s, default: the pak being replaced")
+	package_parser.add_argument("--order", dest="order", metavar="ORDER", choices=["paktrace", "type", "directory"], default="paktrace", help="order files in package by %(metavar)s: paktrace, type (as listed in game profile) or directory, default: %(default)s")
+	package_parser.add_argument("--order-file", dest="order_file", metavar="FILENAME", help="put files listed in %(metavar)s first in package, in listed order")
+	package_parser.add_argument("--variant", dest="variant_list", metavar="OPTIONS", action="append", help="also write a package variant with comma-separated %(metavar)s: policy=profile|store|fast|best|auto, format=dpk|pk3, dir=DIRNAME, name=STRING, example: policy=store,dir=build/test")
+	package_parser.add_argument("--chunk-size", dest="chunk_size", metavar="MIB", type=int, help="write files in chunk paks of at most %(metavar)s mebibytes the pak depends on")
 	package_parser.add_argument("source_dir", nargs="*", metavar="DIRNAME", default=".", help="package from %(metavar)s directory, default: %(default)s")
 
+	# Verify
+	verify_parser = subparsers.add_parser('verify', help='verify a pak against its pakdir')
+	verify_parser.set_defaults(func=verify)
+
+	verify_parser.add_argument("-c", "--compare", dest="compare_pak_list", metavar=("PAK1", "PAK2"), nargs=2, help="compare files of two paks instead")
+	verify_parser.add_argument("source_dir", nargs="*", metavar="DIRNAME", default=".", help="verify pak from %(metavar)s directory, default: %(default)s")
+
+	# Delta
+	delta_parser = subparsers.add_parser('delta', help='package the difference between two paks')
+	delta_parser.set_defaults(func=delta)
+
+	delta_parser.add_argument("-o", "--output", dest="delta_pak_file", metavar="FILENAME", required=True, help="write delta pak as %(metavar)s file")
+	delta_parser.add_argument("old_pak_file", metavar="OLDPAK", help="old pak, the delta pak depends on its version")
+	delta_parser.add_argument("new_pak_file", metavar="NEWPAK", help="new pak")
+
 	# Clean
 	clean_parser = subparsers.add_parser('clean', help='clean pakdir and pak')
 	clean_parser.set_defaults(func=clean)
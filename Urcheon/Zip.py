@@ -0,0 +1,1001 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+
+from Urcheon import Default
+from Urcheon import Parallelism
+from collections import deque
+import concurrent.futures
+import json
+import logging
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+
+# See APPNOTE.TXT from PKWARE for the format description.
+
+local_header_struct = struct.Struct("<4s2B4HL2L2H")
+local_header_signature = b"PK\003\004"
+
+central_header_struct = struct.Struct("<4s4B4HL2L5H2L")
+central_header_signature = b"PK\001\002"
+
+end_struct = struct.Struct("<4s4H2LH")
+end_signature = b"PK\005\006"
+
+zip64_end_struct = struct.Struct("<4sQ2H2L4Q")
+zip64_end_signature = b"PK\006\006"
+
+zip64_locator_struct = struct.Struct("<4sLQL")
+zip64_locator_signature = b"PK\006\007"
+
+zip64_extra_id = 0x0001
+
+zip64_limit = 0xFFFFFFFF
+zip64_count_limit = 0xFFFF
+
+default_version = 20
+zip64_version = 45
+
+# Unix
+create_system = 3
+
+stored_method = 0
+deflated_method = 8
+
+utf8_flag = 0x800
+
+# Files bigger than this are streamed by the writer
+# with a fixed-size buffer instead of being read at once.
+stream_threshold = 64 * 1024 * 1024
+stream_buffer_size = 1024 * 1024
+
+# Memory that entries read or compressed but not written yet
+# can hold, one entry is always let through whatever its size.
+window_memory_size = 256 * 1024 * 1024
+
+
+def getDeflateFlag(level):
+	# Bits 1 and 2 of the general purpose flag tell
+	# which deflate option was used.
+	if level >= 8:
+		# maximum
+		return 0x2
+	elif level >= 3:
+		# normal
+		return 0x0
+	elif level == 2:
+		# fast
+		return 0x4
+	else:
+		# super fast
+		return 0x6
+
+
+def getDosDateTime(date_time):
+	year, month, day, hour, minute, second = date_time
+
+	dos_date = (year - 1980) << 9 | month << 5 | day
+	dos_time = hour << 11 | minute << 5 | (second // 2)
+
+	return dos_date, dos_time
+
+
+def getDateTime(timestamp):
+	date_time = time.localtime(timestamp)[0:6]
+
+	# The zip format cannot store dates before 1980.
+	if date_time[0] < 1980:
+		date_time = (1980, 1, 1, 0, 0, 0)
+
+	return date_time
+
+
+def adviseSequential(file_handle):
+	# Only a hint, not available everywhere.
+	if hasattr(os, "posix_fadvise"):
+		try:
+			os.posix_fadvise(file_handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+		except OSError:
+			pass
+
+
+def getFileCrc(full_path):
+	# Returns the CRC and the size of the file,
+	# read with a fixed-size buffer.
+	crc = 0
+	file_size = 0
+
+	file_handle = open(full_path, "rb")
+	adviseSequential(file_handle)
+
+	while True:
+		data = file_handle.read(stream_buffer_size)
+
+		if not data:
+			break
+
+		crc = zlib.crc32(data, crc)
+		file_size += len(data)
+
+	file_handle.close()
+
+	return crc, file_size
+
+
+def getEntryMemorySize(file_size, output_count=1):
+	# Estimates the memory held by an entry until it is written:
+	# the file data and the data produced for each archive, big
+	# files are streamed with a fixed-size buffer.
+	if file_size >= stream_threshold:
+		return stream_buffer_size
+
+	return file_size * (1 + output_count)
+
+def deflate(data, level):
+	compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+	return compressor.compress(data) + compressor.flush()
+
+def inflate(raw_data):
+	return zlib.decompress(raw_data, -15)
+
+
+class Entry():
+	def __init__(self, file_path, date_time, external_attr):
+		# Archive paths always use slashes, like zipfile does.
+		self.file_path = file_path.replace(os.sep, "/")
+		self.date_time = date_time
+		self.external_attr = external_attr
+
+		self.method = stored_method
+		self.flag_bits = 0
+		self.crc = 0
+		self.file_size = 0
+		self.compress_size = 0
+		self.data = b""
+		self.is_reused = False
+		self.is_cached = False
+
+		# Streamed entries are read by the writer from that path,
+		# deflated if stream_level is set, copied as is otherwise.
+		self.stream_path = None
+		self.stream_offset = 0
+		self.stream_level = None
+		self.is_raw_stream = False
+		self.is_zip64 = False
+
+		self.header_offset = 0
+
+	def setData(self, data, level=None, store_threshold=None, crc=None, deflated_data=None):
+		# With a store threshold, data is stored if deflating
+		# does not save at least that percentage of the size.
+		# CRC and deflated data can be given when already computed.
+		if crc == None:
+			crc = zlib.crc32(data)
+
+		self.crc = crc
+		self.file_size = len(data)
+
+		self.method = stored_method
+		self.data = data
+
+		if level != None:
+			if deflated_data == None:
+				deflated_data = deflate(data, level)
+
+			if store_threshold == None or len(deflated_data) * 100 <= len(data) * (100 - store_threshold):
+				self.method = deflated_method
+				self.flag_bits |= getDeflateFlag(level)
+				self.data = deflated_data
+
+		self.compress_size = len(self.data)
+
+	def setStream(self, stream_path, file_size, level=None):
+		self.stream_path = stream_path
+		self.stream_level = level
+		self.file_size = file_size
+		self.compress_size = file_size
+		self.data = None
+
+		if level != None:
+			self.method = deflated_method
+			self.flag_bits |= getDeflateFlag(level)
+
+		# Sizes are only known once written, deflated data
+		# of incompressible files can be a bit larger.
+		if file_size + (file_size // 1000) + 1024 >= zip64_limit:
+			self.is_zip64 = True
+
+	def setRawStream(self, stream_path, crc, file_size, compress_size, method, flag_bits, stream_offset=0):
+		self.setStream(stream_path, file_size)
+		self.stream_offset = stream_offset
+		self.is_raw_stream = True
+		self.crc = crc
+		self.compress_size = compress_size
+		self.method = method
+		self.flag_bits |= flag_bits
+
+	def setRawData(self, crc, file_size, method, flag_bits, raw_data):
+		self.crc = crc
+		self.file_size = file_size
+		self.method = method
+		self.flag_bits |= flag_bits
+		self.data = raw_data
+		self.compress_size = len(raw_data)
+
+	def getEncodedPath(self):
+		try:
+			return self.file_path.encode("ascii"), 0
+		except UnicodeEncodeError:
+			return self.file_path.encode("utf-8"), utf8_flag
+
+	def getLocalHeader(self):
+		file_name, name_flag = self.getEncodedPath()
+		dos_date, dos_time = getDosDateTime(self.date_time)
+
+		extra = b""
+		version = default_version
+		file_size = self.file_size
+		compress_size = self.compress_size
+
+		if self.is_zip64 or file_size >= zip64_limit or compress_size >= zip64_limit:
+			self.is_zip64 = True
+			extra = struct.pack("<HHQQ", zip64_extra_id, 16, file_size, compress_size)
+			version = zip64_version
+			file_size = zip64_limit
+			compress_size = zip64_limit
+
+		header = local_header_struct.pack(local_header_signature, version, 0,
+			self.flag_bits | name_flag, self.method, dos_time, dos_date,
+			self.crc, compress_size, file_size, len(file_name), len(extra))
+
+		return header + file_name + extra
+
+	def getCentralHeader(self):
+		file_name, name_flag = self.getEncodedPath()
+		dos_date, dos_time = getDosDateTime(self.date_time)
+
+		zip64_list = []
+		version = default_version
+		file_size = self.file_size
+		compress_size = self.compress_size
+		header_offset = self.header_offset
+
+		if file_size >= zip64_limit:
+			zip64_list.append(file_size)
+			file_size = zip64_limit
+
+		if compress_size >= zip64_limit:
+			zip64_list.append(compress_size)
+			compress_size = zip64_limit
+
+		if header_offset >= zip64_limit:
+			zip64_list.append(header_offset)
+			header_offset = zip64_limit
+
+		extra = b""
+		if zip64_list:
+			extra = struct.pack("<HH" + "Q" * len(zip64_list), zip64_extra_id, 8 * len(zip64_list), *zip64_list)
+			version = zip64_version
+
+		header = central_header_struct.pack(central_header_signature, version, create_system,
+			version, 0, self.flag_bits | name_flag, self.method, dos_time, dos_date,
+			self.crc, compress_size, file_size, len(file_name), len(extra), 0, 0, 0,
+			self.external_attr, header_offset)
+
+		return header + file_name + extra
+
+
+class DeflateCache():
+	# Deflated files computed at build time, every cached file
+	# has a metadata file telling from what and how it was produced.
+	def __init__(self, cache_dir):
+		self.cache_dir = cache_dir
+
+	def getDataPath(self, file_path):
+		return os.path.join(self.cache_dir, file_path + Default.deflate_file_ext)
+
+	def getMetaPath(self, file_path):
+		return os.path.join(self.cache_dir, file_path + Default.deflate_meta_ext)
+
+	def getStamp(self, file_stat):
+		return [ file_stat.st_mtime_ns, file_stat.st_size ]
+
+	def readMeta(self, file_path):
+		meta_path = self.getMetaPath(file_path)
+
+		try:
+			meta_file = open(meta_path, "r")
+			meta_dict = json.load(meta_file)
+			meta_file.close()
+		except (OSError, ValueError):
+			return None
+
+		if not isinstance(meta_dict, dict):
+			return None
+
+		return meta_dict
+
+	def write(self, full_path, file_path, level):
+		file_handle = open(full_path, "rb")
+		stamp = self.getStamp(os.fstat(file_handle.fileno()))
+
+		meta_dict = self.readMeta(file_path)
+		if meta_dict and meta_dict.get("stamp") == stamp and meta_dict.get("level") == level:
+			logging.debug("deflated file already cached: " + file_path)
+			file_handle.close()
+			return
+
+		data_path = self.getDataPath(file_path)
+		os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+		adviseSequential(file_handle)
+
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+		crc = 0
+		file_size = 0
+
+		temp_handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(data_path))
+		temp_file = os.fdopen(temp_handle, "wb")
+
+		while True:
+			data = file_handle.read(stream_buffer_size)
+
+			if not data:
+				break
+
+			crc = zlib.crc32(data, crc)
+			file_size += len(data)
+			temp_file.write(compressor.compress(data))
+
+		temp_file.write(compressor.flush())
+		compress_size = temp_file.tell()
+
+		temp_file.close()
+		file_handle.close()
+
+		os.replace(temp_path, data_path)
+
+		meta_dict = {
+			"stamp": stamp,
+			"level": level,
+			"crc": crc,
+			"file_size": file_size,
+			"compress_size": compress_size,
+		}
+
+		# The metadata file is written last so an interrupted
+		# write never gives a wrong cached file.
+		meta_path = self.getMetaPath(file_path)
+		temp_handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path))
+		os.write(temp_handle, json.dumps(meta_dict, sort_keys=True).encode())
+		os.close(temp_handle)
+		os.replace(temp_path, meta_path)
+
+		logging.debug("cached deflated file: " + file_path)
+
+	def find(self, file_stat, file_path, level, store_threshold):
+		# Returns the metadata of the cached file if it can be used.
+		if level == None:
+			return None
+
+		meta_dict = self.readMeta(file_path)
+
+		if meta_dict == None or meta_dict.get("level") != level:
+			return None
+
+		if meta_dict.get("stamp") != self.getStamp(file_stat):
+			return None
+
+		if store_threshold != None and meta_dict["compress_size"] * 100 > meta_dict["file_size"] * (100 - store_threshold):
+			return None
+
+		try:
+			if os.path.getsize(self.getDataPath(file_path)) != meta_dict["compress_size"]:
+				return None
+		except OSError:
+			return None
+
+		return meta_dict
+
+	def read(self, file_path):
+		data_handle = open(self.getDataPath(file_path), "rb")
+		deflated_data = data_handle.read()
+		data_handle.close()
+
+		return deflated_data
+
+	def remove(self, file_path):
+		for cache_path in [ self.getDataPath(file_path), self.getMetaPath(file_path) ]:
+			if os.path.isfile(cache_path):
+				os.remove(cache_path)
+
+	def listFiles(self):
+		file_list = []
+
+		for dir_name, subdir_name_list, file_name_list in os.walk(self.cache_dir):
+			for file_name in file_name_list:
+				if file_name.endswith(Default.deflate_meta_ext):
+					meta_path = os.path.join(dir_name, file_name)
+					file_path = os.path.relpath(meta_path, self.cache_dir)[:-len(Default.deflate_meta_ext)]
+					file_list.append(file_path)
+
+		return file_list
+
+
+class Source():
+	# A file to be written to one or more archives, read
+	# only once and deflated only once per level.
+	def __init__(self, full_path):
+		self.full_path = full_path
+
+		self.file_handle = open(self.full_path, "rb")
+		self.file_stat = os.fstat(self.file_handle.fileno())
+
+		self.data = None
+		self.crc = None
+		self.deflated_dict = {}
+
+	def getData(self):
+		if self.data == None:
+			self.data = self.file_handle.read()
+			self.close()
+
+		return self.data
+
+	def getCrc(self):
+		if self.crc == None:
+			self.crc = zlib.crc32(self.getData())
+
+		return self.crc
+
+	def getDeflated(self, level):
+		if level not in self.deflated_dict:
+			self.deflated_dict[level] = deflate(self.getData(), level)
+
+		return self.deflated_dict[level]
+
+	def close(self):
+		if not self.file_handle.closed:
+			self.file_handle.close()
+
+
+class Reader():
+	# Reads compressed data of entries from an existing archive
+	# so they can be copied as is to a new one.
+	def __init__(self, file_path):
+		self.file_path = file_path
+
+		# Only used to parse the central directory.
+		zip_file = zipfile.ZipFile(self.file_path, "r")
+
+		self.info_dict = {}
+		for zip_info in zip_file.infolist():
+			self.info_dict[zip_info.filename] = zip_info
+
+		zip_file.close()
+
+		self.file_handle = open(self.file_path, "rb")
+		self.lock = threading.Lock()
+
+	def getInfo(self, file_path):
+		return self.info_dict.get(file_path)
+
+	def listInfo(self):
+		# In archive order.
+		return list(self.info_dict.values())
+
+	def findReusable(self, file_path, crc, file_size, level, store_threshold):
+		# Only deflated entries are worth reusing, the previous entry
+		# must have the same CRC and size and would have been produced
+		# with the same compression options, the caller compares the
+		# content.
+		zip_info = self.getInfo(file_path)
+
+		if zip_info == None or level == None:
+			return None
+
+		if zip_info.CRC != crc or zip_info.file_size != file_size:
+			return None
+
+		if zip_info.compress_type != deflated_method:
+			return None
+
+		if zip_info.flag_bits & 0x6 != getDeflateFlag(level):
+			return None
+
+		# Encrypted.
+		if zip_info.flag_bits & 0x1:
+			return None
+
+		if store_threshold != None and zip_info.compress_size * 100 > zip_info.file_size * (100 - store_threshold):
+			return None
+
+		return zip_info
+
+	def getDataOffset(self, zip_info):
+		with self.lock:
+			self.file_handle.seek(zip_info.header_offset)
+			header = self.file_handle.read(local_header_struct.size)
+
+		header_field_list = local_header_struct.unpack(header)
+
+		if header_field_list[0] != local_header_signature:
+			raise zipfile.BadZipFile("bad local header for " + zip_info.filename + " in " + self.file_path)
+
+		name_length = header_field_list[-2]
+		extra_length = header_field_list[-1]
+
+		return zip_info.header_offset + local_header_struct.size + name_length + extra_length
+
+	def readRaw(self, zip_info):
+		data_offset = self.getDataOffset(zip_info)
+
+		with self.lock:
+			self.file_handle.seek(data_offset)
+			return self.file_handle.read(zip_info.compress_size)
+
+	def read(self, zip_info):
+		raw_data = self.readRaw(zip_info)
+
+		if zip_info.compress_type == stored_method:
+			data = raw_data
+		elif zip_info.compress_type == deflated_method:
+			data = inflate(raw_data)
+		else:
+			raise zipfile.BadZipFile("unsupported compression for " + zip_info.filename + " in " + self.file_path)
+
+		if zlib.crc32(data) != zip_info.CRC:
+			raise zipfile.BadZipFile("bad CRC for " + zip_info.filename + " in " + self.file_path)
+
+		return data
+
+	def close(self):
+		self.file_handle.close()
+
+
+class Writer():
+	# Entries are compressed concurrently and written by the
+	# calling thread in the order they were added, so the
+	# archive is the same whatever the thread count is.
+	def __init__(self, file_path, thread_count=None, previous_reader=None, deflate_cache=None):
+		self.file_path = file_path
+
+		# Files deflated at build time are copied from the cache.
+		self.deflate_cache = deflate_cache
+		self.cached_count = 0
+
+		# Unmodified entries are copied from the previous archive.
+		self.previous_reader = previous_reader
+		self.reused_count = 0
+
+		if thread_count == None:
+			thread_count = Parallelism.countCPU()
+
+		self.thread_count = max(1, thread_count)
+
+		# Bound the amount of data kept in memory, both
+		# in entry count and in bytes.
+		self.window_size = self.thread_count * 2
+		self.window_memory = 0
+
+		# Created on first use, writers used by a MultiWriter
+		# don't need their own threads.
+		self.executor = None
+		self.future_queue = deque()
+		self.entry_list = []
+
+		logging.debug("opening: " + self.file_path)
+		self.file_handle = open(self.file_path, "wb")
+
+	def submit(self, memory_size, function, *args):
+		if self.executor == None:
+			self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_count)
+
+		self.future_queue.append((self.executor.submit(function, *args), memory_size))
+		self.window_memory += memory_size
+
+		while len(self.future_queue) > self.window_size \
+			or (len(self.future_queue) > 1 and self.window_memory > window_memory_size):
+			self.writeNextEntry()
+
+	def writeNextEntry(self):
+		future, memory_size = self.future_queue.popleft()
+		self.writeEntry(future.result())
+		self.window_memory -= memory_size
+
+	def addFile(self, full_path, file_path, level=None, store_threshold=None):
+		memory_size = getEntryMemorySize(os.stat(full_path).st_size)
+		self.submit(memory_size, self.readFile, full_path, file_path, level, store_threshold)
+
+	def addSymlink(self, full_path, file_path):
+		self.submit(0, self.readSymlink, full_path, file_path)
+
+	def addBytes(self, file_path, data, date_time=None, external_attr=None, level=None, store_threshold=None):
+		if date_time == None:
+			date_time = getDateTime(time.time())
+
+		if external_attr == None:
+			external_attr = (stat.S_IFREG | 0o644) << 16
+
+		memory_size = getEntryMemorySize(len(data))
+		self.submit(memory_size, self.readBytes, file_path, data, date_time, external_attr, level, store_threshold)
+
+	def addArchived(self, reader, zip_info):
+		memory_size = getEntryMemorySize(zip_info.compress_size, output_count=0)
+		self.submit(memory_size, self.readArchived, reader, zip_info)
+
+	def readFile(self, full_path, file_path, level, store_threshold):
+		source = Source(full_path)
+		entry = self.makeFileEntry(source, file_path, level, store_threshold)
+		source.close()
+
+		return entry
+
+	def makeFileEntry(self, source, file_path, level, store_threshold):
+		file_stat = source.file_stat
+
+		entry = Entry(file_path, getDateTime(file_stat.st_mtime), (file_stat.st_mode & 0xFFFF) << 16)
+
+		if self.deflate_cache:
+			meta_dict = self.deflate_cache.find(file_stat, file_path, level, store_threshold)
+
+			if meta_dict:
+				logging.debug("using deflated file from cache: " + file_path)
+
+				entry.is_cached = True
+
+				if meta_dict["compress_size"] >= stream_threshold:
+					entry.setRawStream(self.deflate_cache.getDataPath(file_path), meta_dict["crc"], meta_dict["file_size"], meta_dict["compress_size"], deflated_method, getDeflateFlag(level))
+				else:
+					raw_data = self.deflate_cache.read(file_path)
+					entry.setRawData(meta_dict["crc"], meta_dict["file_size"], deflated_method, getDeflateFlag(level), raw_data)
+
+				return entry
+
+		# Big files are streamed by the writer, they are always
+		# deflated when a level is given, whatever the store threshold.
+		if file_stat.st_size >= stream_threshold:
+			entry.setStream(source.full_path, file_stat.st_size, level=level)
+			return entry
+
+		data = source.getData()
+
+		if self.previous_reader:
+			zip_info = self.previous_reader.findReusable(file_path, source.getCrc(), len(data), level, store_threshold)
+
+			if zip_info:
+				raw_data = self.previous_reader.readRaw(zip_info)
+
+				# Different contents can have the same CRC, previous data
+				# is inflated and compared, which is much faster than
+				# deflating again.
+				try:
+					is_same = inflate(raw_data) == data
+				except zlib.error:
+					is_same = False
+
+				if is_same:
+					logging.debug("reusing compressed data from previous archive: " + file_path)
+					entry.setRawData(zip_info.CRC, zip_info.file_size, zip_info.compress_type, zip_info.flag_bits & 0x6, raw_data)
+					entry.is_reused = True
+					return entry
+
+		deflated_data = None
+		if level != None:
+			deflated_data = source.getDeflated(level)
+
+		entry.setData(data, level=level, store_threshold=store_threshold, crc=source.getCrc(), deflated_data=deflated_data)
+
+		return entry
+
+	def readSymlink(self, full_path, file_path):
+		# The date is the one of the target file if it exists.
+		try:
+			file_stat = os.stat(full_path)
+		except OSError:
+			file_stat = os.lstat(full_path)
+
+		entry = Entry(file_path, getDateTime(file_stat.st_mtime), (0o777 | stat.S_IFLNK) << 16)
+
+		entry.setData(os.readlink(full_path).encode())
+
+		return entry
+
+	def readArchived(self, reader, zip_info, raw_data=None):
+		# Copies the entry from another archive without
+		# decompressing it, raw data can be given if already read.
+		if zip_info.flag_bits & 0x1:
+			raise zipfile.BadZipFile("can't copy encrypted file " + zip_info.filename + " from " + reader.file_path)
+
+		entry = Entry(zip_info.filename, zip_info.date_time, zip_info.external_attr)
+
+		if zip_info.compress_size >= stream_threshold:
+			entry.setRawStream(reader.file_path, zip_info.CRC, zip_info.file_size, zip_info.compress_size, zip_info.compress_type, zip_info.flag_bits & 0x6, stream_offset=reader.getDataOffset(zip_info))
+		else:
+			if raw_data == None:
+				raw_data = reader.readRaw(zip_info)
+
+			entry.setRawData(zip_info.CRC, zip_info.file_size, zip_info.compress_type, zip_info.flag_bits & 0x6, raw_data)
+
+		return entry
+
+	def readBytes(self, file_path, data, date_time, external_attr, level, store_threshold):
+		entry = Entry(file_path, date_time, external_attr)
+		entry.setData(data, level=level, store_threshold=store_threshold)
+
+		return entry
+
+	def writeEntry(self, entry):
+		entry.header_offset = self.file_handle.tell()
+
+		if entry.stream_path:
+			self.writeStream(entry)
+		else:
+			self.file_handle.write(entry.getLocalHeader())
+			self.file_handle.write(entry.data)
+
+		if entry.is_reused:
+			self.reused_count += 1
+
+		if entry.is_cached:
+			self.cached_count += 1
+
+		# Only the central directory is kept.
+		entry.data = None
+		self.entry_list.append(entry)
+
+	def writeStream(self, entry):
+		is_raw = entry.is_raw_stream
+
+		# Sizes and CRC of streamed files are written once known.
+		local_header = entry.getLocalHeader()
+		self.file_handle.write(local_header)
+
+		stream_handle = open(entry.stream_path, "rb")
+		stream_handle.seek(entry.stream_offset)
+		adviseSequential(stream_handle)
+
+		compressor = None
+		if entry.stream_level != None:
+			compressor = zlib.compressobj(entry.stream_level, zlib.DEFLATED, -15)
+
+		crc = 0
+		file_size = 0
+		compress_size = 0
+
+		# Raw data may be followed by other entries.
+		remaining_size = entry.compress_size
+
+		while True:
+			read_size = stream_buffer_size
+
+			if is_raw:
+				read_size = min(read_size, remaining_size)
+				remaining_size -= read_size
+
+			data = stream_handle.read(read_size)
+
+			if not data:
+				break
+
+			if not is_raw:
+				crc = zlib.crc32(data, crc)
+				file_size += len(data)
+
+				if compressor:
+					data = compressor.compress(data)
+
+			self.file_handle.write(data)
+			compress_size += len(data)
+
+		if compressor:
+			data = compressor.flush()
+			self.file_handle.write(data)
+			compress_size += len(data)
+
+		stream_handle.close()
+
+		if is_raw:
+			if compress_size != entry.compress_size:
+				raise EOFError("truncated file while copying " + entry.file_path + " from " + entry.stream_path)
+
+			return
+
+		entry.crc = crc
+		entry.file_size = file_size
+		entry.compress_size = compress_size
+
+		end_offset = self.file_handle.tell()
+
+		# CRC and sizes are at offset 14 of the local header.
+		self.file_handle.seek(entry.header_offset + 14)
+
+		if entry.is_zip64:
+			self.file_handle.write(struct.pack("<LLL", crc, zip64_limit, zip64_limit))
+
+			# Sizes in the zip64 extra field after the file name
+			# and the extra field header.
+			file_name, name_flag = entry.getEncodedPath()
+			self.file_handle.seek(entry.header_offset + local_header_struct.size + len(file_name) + 4)
+			self.file_handle.write(struct.pack("<QQ", file_size, compress_size))
+		else:
+			if file_size >= zip64_limit or compress_size >= zip64_limit:
+				raise OverflowError("streamed file grew too much to be stored without zip64: " + entry.stream_path)
+
+			self.file_handle.write(struct.pack("<LLL", crc, compress_size, file_size))
+
+		self.file_handle.seek(end_offset)
+
+	def close(self):
+		while self.future_queue:
+			self.writeNextEntry()
+
+		if self.executor != None:
+			self.executor.shutdown()
+
+		central_offset = self.file_handle.tell()
+
+		for entry in self.entry_list:
+			self.file_handle.write(entry.getCentralHeader())
+
+		central_size = self.file_handle.tell() - central_offset
+		entry_count = len(self.entry_list)
+
+		if entry_count >= zip64_count_limit or central_offset >= zip64_limit or central_size >= zip64_limit:
+			zip64_end_offset = self.file_handle.tell()
+
+			self.file_handle.write(zip64_end_struct.pack(zip64_end_signature,
+				zip64_end_struct.size - 12, zip64_version, zip64_version, 0, 0,
+				entry_count, entry_count, central_size, central_offset))
+
+			self.file_handle.write(zip64_locator_struct.pack(zip64_locator_signature,
+				0, zip64_end_offset, 1))
+
+			entry_count = min(entry_count, zip64_count_limit)
+			central_offset = min(central_offset, zip64_limit)
+			central_size = min(central_size, zip64_limit)
+
+		self.file_handle.write(end_struct.pack(end_signature, 0, 0,
+			entry_count, entry_count, central_size, central_offset, 0))
+
+		logging.debug("close: " + self.file_path)
+		self.file_handle.close()
+
+
+class MultiWriter():
+	# Writes the same files to several archives with
+	# different compression options, reading them once.
+	# Options are given per writer as (level, store_threshold)
+	# tuples, or None to not write the file to that archive.
+	def __init__(self, writer_list, thread_count=None):
+		self.writer_list = writer_list
+
+		if thread_count == None:
+			thread_count = Parallelism.countCPU()
+
+		self.thread_count = max(1, thread_count)
+
+		# Bound the amount of data kept in memory, both
+		# in entry count and in bytes.
+		self.window_size = self.thread_count * 2
+		self.window_memory = 0
+
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_count)
+		self.future_queue = deque()
+
+	def submit(self, memory_size, function, *args):
+		self.future_queue.append((self.executor.submit(function, *args), memory_size))
+		self.window_memory += memory_size
+
+		while len(self.future_queue) > self.window_size \
+			or (len(self.future_queue) > 1 and self.window_memory > window_memory_size):
+			self.writeNextEntries()
+
+	def writeNextEntries(self):
+		future, memory_size = self.future_queue.popleft()
+		self.writeEntries(future.result())
+		self.window_memory -= memory_size
+
+	def getOutputCount(self, option_list):
+		return len([option_tuple for option_tuple in option_list if option_tuple != None])
+
+	def addFile(self, full_path, file_path, option_list):
+		memory_size = getEntryMemorySize(os.stat(full_path).st_size, output_count=self.getOutputCount(option_list))
+		self.submit(memory_size, self.readFile, full_path, file_path, option_list)
+
+	def addSymlink(self, full_path, file_path, option_list):
+		self.submit(0, self.readSymlink, full_path, file_path, option_list)
+
+	def addBytes(self, file_path, data, option_list, date_time=None, external_attr=None):
+		if date_time == None:
+			date_time = getDateTime(time.time())
+
+		if external_attr == None:
+			external_attr = (stat.S_IFREG | 0o644) << 16
+
+		memory_size = getEntryMemorySize(len(data), output_count=self.getOutputCount(option_list))
+		self.submit(memory_size, self.readBytes, file_path, data, date_time, external_attr, option_list)
+
+	def addArchived(self, reader, zip_info, option_list):
+		# Entries from other archives are copied as is
+		# whatever the compression options are.
+		memory_size = getEntryMemorySize(zip_info.compress_size, output_count=0)
+		self.submit(memory_size, self.readArchived, reader, zip_info, option_list)
+
+	def readFile(self, full_path, file_path, option_list):
+		source = Source(full_path)
+
+		entry_list = []
+		for writer, option_tuple in zip(self.writer_list, option_list):
+			if option_tuple == None:
+				entry_list.append(None)
+			else:
+				level, store_threshold = option_tuple
+				entry_list.append(writer.makeFileEntry(source, file_path, level, store_threshold))
+
+		source.close()
+
+		return entry_list
+
+	def readSymlink(self, full_path, file_path, option_list):
+		entry_list = []
+		for writer, option_tuple in zip(self.writer_list, option_list):
+			if option_tuple == None:
+				entry_list.append(None)
+			else:
+				entry_list.append(writer.readSymlink(full_path, file_path))
+
+		return entry_list
+
+	def readArchived(self, reader, zip_info, option_list):
+		# Big entries are streamed by each writer.
+		raw_data = None
+		if zip_info.compress_size < stream_threshold:
+			raw_data = reader.readRaw(zip_info)
+
+		entry_list = []
+		for writer, option_tuple in zip(self.writer_list, option_list):
+			if option_tuple == None:
+				entry_list.append(None)
+			else:
+				entry_list.append(writer.readArchived(reader, zip_info, raw_data=raw_data))
+
+		return entry_list
+
+	def readBytes(self, file_path, data, date_time, external_attr, option_list):
+		entry_list = []
+		for writer, option_tuple in zip(self.writer_list, option_list):
+			if option_tuple == None:
+				entry_list.append(None)
+			else:
+				level, store_threshold = option_tuple
+				entry_list.append(writer.readBytes(file_path, data, date_time, external_attr, level, store_threshold))
+
+		return entry_list
+
+	def writeEntries(self, entry_list):
+		for writer, entry in zip(self.writer_list, entry_list):
+			if entry != None:
+				writer.writeEntry(entry)
+
+	def close(self):
+		while self.future_queue:
+			self.writeNextEntries()
+
+		self.executor.shutdown()
+
+		for writer in self.writer_list:
+			writer.close()
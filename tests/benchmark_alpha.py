@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+# Times the opaque image check done when converting textures,
+# comparing the alpha channel extrema with the former scan
+# of every pixel in Python.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from Urcheon import Pixmap
+
+
+def isOpaqueByPixel(image):
+	# The check done before Pixmap.isOpaque.
+	for x in range(0, image.width):
+		for y in range(0, image.height):
+			if image.getpixel((x, y))[3] != 255:
+				return False
+
+	return True
+
+def timeCheck(check_function, image, run_count):
+	duration_list = []
+
+	for run_index in range(run_count):
+		start_time = time.perf_counter()
+		is_opaque = check_function(image)
+		duration_list.append(time.perf_counter() - start_time)
+
+	return min(duration_list), is_opaque
+
+def main():
+	parser = argparse.ArgumentParser(description="%(prog)s times the opaque image check.")
+	parser.add_argument("--sizes", dest="size_list", metavar="SIZE", type=int, nargs="+", default=[256, 1024, 2048], help="check opaque square images of %(metavar)s pixels wide, default: %(default)s")
+	parser.add_argument("--runs", dest="run_count", metavar="COUNT", type=int, default=3, help="keep the fastest of %(metavar)s runs, default: %(default)s")
+
+	args = parser.parse_args()
+
+	for size in args.size_list:
+		# Opaque images are the worst case, every pixel is checked.
+		image = Image.new("RGBA", (size, size), (128, 128, 128, 255))
+
+		pixel_duration, pixel_is_opaque = timeCheck(isOpaqueByPixel, image, args.run_count)
+		extrema_duration, extrema_is_opaque = timeCheck(Pixmap.isOpaque, image, args.run_count)
+
+		if pixel_is_opaque != extrema_is_opaque:
+			print("different decision for " + str(size) + "×" + str(size) + " image")
+			sys.exit(1)
+
+		size_string = (str(size) + "×" + str(size)).ljust(12)
+		pixel_string = ("%.1f" % (pixel_duration * 1000)).rjust(9)
+		extrema_string = ("%.2f" % (extrema_duration * 1000)).rjust(7)
+
+		print(size_string + "per pixel " + pixel_string + " ms, extrema " + extrema_string + " ms")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+# Times short urcheon and esquirel commands on a generated pakdir,
+# scripts call them hundreds of times per release so their start-up
+# time matters. Pass the prefix of another checkout to compare.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generateTree(temp_dir, file_count):
+	source_dir = os.path.join(temp_dir, "bench_src.dpkdir")
+
+	for file_index in range(file_count):
+		for file_path in [
+			"textures/bench/image" + str(file_index) + ".png",
+			"sound/bench/sound" + str(file_index) + ".wav",
+			"scripts/bench" + str(file_index) + ".shader",
+		]:
+			full_path = os.path.join(source_dir, file_path)
+			os.makedirs(os.path.dirname(full_path), exist_ok=True)
+			open(full_path, "wb").close()
+
+	return source_dir
+
+def timeCommand(command_list, run_count):
+	duration_list = []
+
+	for run_index in range(run_count):
+		start_time = time.perf_counter()
+		subprocess.run(command_list, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+		duration_list.append(time.perf_counter() - start_time)
+
+	return duration_list
+
+def main():
+	repository_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+	parser = argparse.ArgumentParser(description="%(prog)s times urcheon and esquirel start-up.")
+	parser.add_argument("--prefix", dest="prefix_dir", metavar="DIRNAME", default=repository_dir, help="run commands from %(metavar)s/bin, default: %(default)s")
+	parser.add_argument("--runs", dest="run_count", metavar="COUNT", type=int, default=20, help="run each command %(metavar)s times, default: %(default)s")
+	parser.add_argument("--files", dest="file_count", metavar="COUNT", type=int, default=100, help="generate %(metavar)s files of each type, default: %(default)s")
+
+	args = parser.parse_args()
+
+	urcheon_command = [sys.executable, os.path.join(args.prefix_dir, "bin", "urcheon")]
+	esquirel_command = [sys.executable, os.path.join(args.prefix_dir, "bin", "esquirel")]
+
+	with tempfile.TemporaryDirectory() as temp_dir:
+		source_dir = generateTree(temp_dir, args.file_count)
+
+		command_dict = {
+			"urcheon --help": urcheon_command + ["--help"],
+			"urcheon clean": urcheon_command + ["--game", "unvanquished", "clean", "-b", source_dir],
+			"urcheon discover": urcheon_command + ["--game", "unvanquished", "discover", source_dir],
+			"esquirel --help": esquirel_command + ["--help"],
+		}
+
+		for command_name, command_list in command_dict.items():
+			duration_list = timeCommand(command_list, args.run_count)
+
+			median_string = "%.1f" % (statistics.median(duration_list) * 1000)
+			min_string = "%.1f" % (min(duration_list) * 1000)
+
+			print(command_name.ljust(24) + "median " + median_string.rjust(7) + " ms, min " + min_string.rjust(7) + " ms")
+
+if __name__ == "__main__":
+	main()
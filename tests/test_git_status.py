@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Repository
+
+
+class TestGitStatus(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		self.source_dir = os.path.join(self.temp_dir.name, "foo_src.dpkdir")
+		os.makedirs(os.path.join(self.source_dir, "scripts"))
+
+		shader_file = open(os.path.join(self.source_dir, "scripts", "foo.shader"), "w")
+		shader_file.write("textures/foo/bar\n{\n}\n")
+		shader_file.close()
+
+		git_command = ["git", "-C", self.source_dir, "-c", "user.name=Foo", "-c", "user.email=foo@example.com"]
+		subprocess.run(git_command + ["init", "-q"], check=True)
+		subprocess.run(git_command + ["add", "."], check=True)
+		subprocess.run(git_command + ["commit", "-q", "-m", "foo"], check=True)
+
+	def tearDown(self):
+		Repository.git_cache_dict.pop(os.path.realpath(self.source_dir), None)
+		self.temp_dir.cleanup()
+
+	def test_reset_status(self):
+		git_repo = Repository.Git(self.source_dir, "dpk")
+		self.assertFalse(git_repo.isDirty())
+
+		# Like a file written by the prepare stage.
+		open(os.path.join(self.source_dir, "scripts", "bar.shader"), "w").close()
+
+		self.assertFalse(git_repo.isDirty())
+
+		Repository.getGitCache(self.source_dir).resetStatus()
+
+		self.assertTrue(git_repo.isDirty())
+		self.assertEqual(git_repo.listUntrackedFiles(), ["scripts/bar.shader"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from Urcheon import Action
+from Urcheon import Pixmap
+from Urcheon import Repository
+
+
+class TestImageCache(unittest.TestCase):
+	file_path = "textures/foo/bar.png"
+
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		# Profiles read by the source tree are cached there.
+		self.cache_home = os.path.join(self.temp_dir.name, "cache")
+		self.previous_cache_home = os.environ.get("XDG_CACHE_HOME")
+		os.environ["XDG_CACHE_HOME"] = self.cache_home
+
+		self.source_dir = os.path.join(self.temp_dir.name, "foo_src.dpkdir")
+		self.build_dir = os.path.join(self.temp_dir.name, "foo_test.dpkdir")
+
+		self.source_path = os.path.join(self.source_dir, self.file_path)
+		os.makedirs(os.path.dirname(self.source_path))
+
+		image = Image.new("RGBA", (16, 16), (255, 0, 0, 128))
+		image.save(self.source_path)
+
+		self.source_tree = Repository.Tree(self.source_dir, game_name="unvanquished")
+
+	def tearDown(self):
+		if self.previous_cache_home == None:
+			del os.environ["XDG_CACHE_HOME"]
+		else:
+			os.environ["XDG_CACHE_HOME"] = self.previous_cache_home
+
+		self.temp_dir.cleanup()
+
+	def getAction(self, action_type, image_cache):
+		return action_type(self.source_tree, self.build_dir, self.file_path, "build", image_cache=image_cache)
+
+	def openImageList(self, action_list):
+		# Returns the images and how many times the source was decoded.
+		with mock.patch("PIL.Image.open", wraps=Image.open) as open_mock:
+			image_list = [action.openAndSanitizeImage() for action in action_list]
+
+		return image_list, open_mock.call_count
+
+	def test_source_converted_twice(self):
+		image_cache = Pixmap.ImageCache(1024 * 1024)
+
+		action_list = [
+			self.getAction(Action.ConvertJpg, image_cache),
+			self.getAction(Action.ConvertPng, image_cache),
+		]
+
+		for action in action_list:
+			image_cache.expect(action.getSourcePath())
+
+		image_list, open_count = self.openImageList(action_list)
+
+		self.assertEqual(open_count, 1)
+		self.assertEqual(image_list[0].mode, "RGBA")
+		self.assertEqual(image_list[0].tobytes(), image_list[1].tobytes())
+
+		# The image is dropped after its last expected use.
+		self.assertEqual(len(image_cache.image_dict), 0)
+		self.assertEqual(image_cache.size, 0)
+
+	def test_source_converted_once(self):
+		image_cache = Pixmap.ImageCache(1024 * 1024)
+
+		action = self.getAction(Action.ConvertPng, image_cache)
+		image_cache.expect(action.getSourcePath())
+
+		image_list, open_count = self.openImageList([action])
+
+		self.assertEqual(open_count, 1)
+		self.assertEqual(len(image_cache.image_dict), 0)
+
+	def test_decoding_actions(self):
+		# Copying a png to png doesn't decode it.
+		self.assertTrue(self.getAction(Action.ConvertJpg, None).decodesImage())
+		self.assertFalse(self.getAction(Action.ConvertPng, None).decodesImage())
+		self.assertFalse(self.getAction(Action.Copy, None).decodesImage())
+
+	def test_released_use(self):
+		# An action already done releases its use,
+		# the image is not kept for it.
+		image_cache = Pixmap.ImageCache(1024 * 1024)
+
+		action_list = [
+			self.getAction(Action.ConvertJpg, image_cache),
+			self.getAction(Action.ConvertBadJpg, image_cache),
+		]
+
+		for action in action_list:
+			image_cache.expect(action.getSourcePath())
+
+		image_cache.release(action_list[0].getSourcePath())
+
+		image_list, open_count = self.openImageList(action_list[1:])
+
+		self.assertEqual(open_count, 1)
+		self.assertEqual(len(image_cache.image_dict), 0)
+
+	def test_modified_source(self):
+		image_cache = Pixmap.ImageCache(1024 * 1024)
+
+		action_list = [
+			self.getAction(Action.ConvertJpg, image_cache),
+			self.getAction(Action.ConvertPng, image_cache),
+		]
+
+		for action in action_list:
+			image_cache.expect(action.getSourcePath())
+
+		image_list, open_count = self.openImageList(action_list[:1])
+
+		image = Image.new("RGBA", (8, 8), (0, 255, 0, 128))
+		image.save(self.source_path)
+		os.utime(self.source_path, ns=(0, 0))
+
+		image_list, open_count = self.openImageList(action_list[1:])
+
+		self.assertEqual(open_count, 1)
+		self.assertEqual(image_list[0].size, (8, 8))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Repository
+
+
+class TestPaktrace(unittest.TestCase):
+	tracked_file_path = "scripts/foo.shader"
+	untracked_file_path = "scripts/bar.shader"
+
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		self.cache_home = os.path.join(self.temp_dir.name, "cache")
+		self.previous_cache_home = os.environ.get("XDG_CACHE_HOME")
+		os.environ["XDG_CACHE_HOME"] = self.cache_home
+
+		self.source_dir = os.path.join(self.temp_dir.name, "foo_src.dpkdir")
+		self.build_dir = os.path.join(self.temp_dir.name, "foo_test.dpkdir")
+
+		self.writeFile(self.source_dir, self.tracked_file_path)
+
+		git_command = ["git", "-C", self.source_dir, "-c", "user.name=Foo", "-c", "user.email=foo@example.com"]
+		subprocess.run(git_command + ["init", "-q"], check=True)
+		subprocess.run(git_command + ["add", "."], check=True)
+		subprocess.run(git_command + ["commit", "-q", "-m", "foo"], check=True)
+
+		self.writeFile(self.source_dir, self.untracked_file_path)
+
+		self.source_tree = Repository.Tree(self.source_dir, game_name="unvanquished")
+		self.source_tree.use_git_object_id = True
+
+	def tearDown(self):
+		Repository.git_cache_dict.pop(os.path.realpath(self.source_dir), None)
+
+		if self.previous_cache_home == None:
+			del os.environ["XDG_CACHE_HOME"]
+		else:
+			os.environ["XDG_CACHE_HOME"] = self.previous_cache_home
+
+		self.temp_dir.cleanup()
+
+	def writeFile(self, dir_path, file_path):
+		full_path = os.path.join(dir_path, file_path)
+		os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+		shader_file = open(full_path, "w")
+		shader_file.write(file_path + "\n{\n}\n")
+		shader_file.close()
+
+	def readSourceDict(self, file_path):
+		self.writeFile(self.build_dir, file_path)
+
+		paktrace = Repository.Paktrace(self.source_tree, self.build_dir)
+		paktrace.write(file_path, file_path, [])
+
+		paktrace_file = open(paktrace.getPath(file_path), "r")
+		json_dict = json.loads(paktrace_file.read())
+		paktrace_file.close()
+
+		return json_dict["input"][file_path]
+
+	def test_tracked_file(self):
+		# Git already hashed tracked unmodified files.
+		source_dict = self.readSourceDict(self.tracked_file_path)
+
+		self.assertIn("gitobject", source_dict)
+		self.assertNotIn("sha256sum", source_dict)
+
+	def test_untracked_file(self):
+		source_dict = self.readSourceDict(self.untracked_file_path)
+
+		self.assertNotIn("gitobject", source_dict)
+		self.assertIn("sha256sum", source_dict)
+
+
+if __name__ == "__main__":
+	unittest.main()
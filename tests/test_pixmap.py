@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from Urcheon import Pixmap
+
+
+class TestStripOpaqueAlpha(unittest.TestCase):
+	image_size = (64, 32)
+
+	def test_opaque_image(self):
+		image = Image.new("RGBA", self.image_size, (12, 34, 56, 255))
+
+		stripped_image = Pixmap.stripOpaqueAlpha(image)
+
+		self.assertEqual(stripped_image.mode, "RGB")
+		self.assertEqual(stripped_image.getpixel((0, 0)), (12, 34, 56))
+
+	def test_single_translucent_pixel(self):
+		# A single pixel at alpha 254 keeps the alpha channel,
+		# wherever it is in the image.
+		width, height = self.image_size
+
+		for position in [(0, 0), (width // 2, height // 2), (width - 1, height - 1)]:
+			image = Image.new("RGBA", self.image_size, (12, 34, 56, 255))
+			image.putpixel(position, (12, 34, 56, 254))
+
+			stripped_image = Pixmap.stripOpaqueAlpha(image)
+
+			self.assertEqual(stripped_image.mode, "RGBA")
+			self.assertEqual(stripped_image.getpixel(position), (12, 34, 56, 254))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Profile
+from Urcheon import Repository
+
+
+class TestProfileCache(unittest.TestCase):
+	# Those files match file types having the same weight, the
+	# file type order must not depend on the profile cache.
+	file_path_list = [
+		"gfx/foo_n.png",
+		"gfx/foo_p.png",
+		"gfx/foo_d.png",
+		"textures/foo/bar_n.png",
+		"scripts/foo.shader",
+	]
+
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		self.cache_home = os.path.join(self.temp_dir.name, "cache")
+		self.previous_cache_home = os.environ.get("XDG_CACHE_HOME")
+		os.environ["XDG_CACHE_HOME"] = self.cache_home
+
+		self.source_dir = os.path.join(self.temp_dir.name, "foo_src.dpkdir")
+
+		for file_path in self.file_path_list:
+			full_path = os.path.join(self.source_dir, file_path)
+			os.makedirs(os.path.dirname(full_path), exist_ok=True)
+			open(full_path, "wb").close()
+
+	def tearDown(self):
+		if self.previous_cache_home == None:
+			del os.environ["XDG_CACHE_HOME"]
+		else:
+			os.environ["XDG_CACHE_HOME"] = self.previous_cache_home
+
+		self.temp_dir.cleanup()
+
+	def inspect(self):
+		# Forget what was read by this process.
+		Profile.fs_dict.clear()
+		Profile.toml_dict.clear()
+
+		source_tree = Repository.Tree(self.source_dir, game_name="unvanquished")
+		inspector = Repository.Inspector(source_tree, "build")
+
+		return [inspector.inspect(file_path) for file_path in self.file_path_list]
+
+	def test_cold_and_warm_cache(self):
+		cold_action_list = self.inspect()
+		self.assertTrue(os.path.isdir(os.path.join(self.cache_home, "urcheon", "profile")))
+
+		warm_action_list = self.inspect()
+
+		self.assertEqual(cold_action_list, warm_action_list)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Default
+from Urcheon import Repository
+
+
+class TestVersionCache(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		self.cache_home = os.path.join(self.temp_dir.name, "cache")
+		self.previous_cache_home = os.environ.get("XDG_CACHE_HOME")
+		os.environ["XDG_CACHE_HOME"] = self.cache_home
+
+		self.source_dir = os.path.join(self.temp_dir.name, "foo_src.dpkdir")
+		os.makedirs(self.source_dir)
+
+		self.git_command = ["git", "-C", self.source_dir, "-c", "user.name=Foo", "-c", "user.email=foo@example.com"]
+		subprocess.run(self.git_command + ["init", "-q"], check=True)
+
+		self.cache_dir = os.path.join(Default.getUserCacheDir(), Default.version_cache_dir)
+
+	def tearDown(self):
+		Repository.git_cache_dict.pop(os.path.realpath(self.source_dir), None)
+
+		if self.previous_cache_home == None:
+			del os.environ["XDG_CACHE_HOME"]
+		else:
+			os.environ["XDG_CACHE_HOME"] = self.previous_cache_home
+
+		self.temp_dir.cleanup()
+
+	def commit(self, file_name):
+		open(os.path.join(self.source_dir, file_name), "w").close()
+		subprocess.run(self.git_command + ["add", "."], check=True)
+		subprocess.run(self.git_command + ["commit", "-q", "-m", file_name], check=True)
+
+	def getVersion(self):
+		# Forget what was computed by this process.
+		Repository.git_cache_dict.pop(os.path.realpath(self.source_dir), None)
+
+		return Repository.Git(self.source_dir, "dpk").getVersion()
+
+	def test_one_file_per_source_directory(self):
+		os.makedirs(self.cache_dir)
+
+		# Written by the older format, one file per key.
+		legacy_file = open(os.path.join(self.cache_dir, "legacy" + Default.version_cache_ext), "w")
+		legacy_file.write(json.dumps({"key": json.dumps([1, "0" * 40]), "version": "0"}))
+		legacy_file.close()
+
+		version_list = []
+		for file_name in ["foo", "bar", "baz"]:
+			self.commit(file_name)
+			version_list.append(self.getVersion())
+
+			self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+		self.assertEqual(len(set(version_list)), 3)
+
+		# Read from the cache.
+		self.assertEqual(self.getVersion(), version_list[-1])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Zip
+
+
+def forgeCrc(prefix, crc):
+	# Returns prefix followed by 4 bytes so the CRC of the whole
+	# is the given one. The CRC of the last 4 bytes is affine,
+	# the linear system is solved over GF(2).
+	base_crc = zlib.crc32(prefix + bytes(4))
+
+	row_list = []
+	for bit_index in range(32):
+		suffix = (1 << bit_index).to_bytes(4, "little")
+		row_list.append((zlib.crc32(prefix + suffix) ^ base_crc, 1 << bit_index))
+
+	target = crc ^ base_crc
+	solution = 0
+
+	for bit_index in range(32):
+		mask = 1 << bit_index
+		pivot_list = [row for row in row_list if row[0] & mask]
+
+		if not pivot_list:
+			continue
+
+		pivot = pivot_list[0]
+		row_list.remove(pivot)
+		row_list = [(row[0] ^ pivot[0], row[1] ^ pivot[1]) if row[0] & mask else row for row in row_list]
+
+		if target & mask:
+			target ^= pivot[0]
+			solution ^= pivot[1]
+
+	return prefix + solution.to_bytes(4, "little")
+
+
+class TestPreviousPakReuse(unittest.TestCase):
+	file_path = "scripts/foo.shader"
+
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+		self.full_path = os.path.join(self.temp_dir.name, "foo.shader")
+		self.previous_pak = os.path.join(self.temp_dir.name, "previous.dpk")
+		self.pak = os.path.join(self.temp_dir.name, "new.dpk")
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def writePak(self, pak_file, data, previous_reader=None):
+		source_file = open(self.full_path, "wb")
+		source_file.write(data)
+		source_file.close()
+
+		writer = Zip.Writer(pak_file, thread_count=1, previous_reader=previous_reader)
+		writer.addFile(self.full_path, self.file_path, level=zlib.Z_BEST_COMPRESSION)
+		writer.close()
+
+		return writer
+
+	def repackage(self, previous_data, data):
+		self.writePak(self.previous_pak, previous_data)
+
+		previous_reader = Zip.Reader(self.previous_pak)
+		writer = self.writePak(self.pak, data, previous_reader=previous_reader)
+		previous_reader.close()
+
+		zip_file = zipfile.ZipFile(self.pak, "r")
+		written_data = zip_file.read(self.file_path)
+		zip_file.close()
+
+		return writer.reused_count, written_data
+
+	def test_same_content(self):
+		data = b"textures/foo/bar\n{\n}\n" * 64
+
+		reused_count, written_data = self.repackage(data, data)
+
+		self.assertEqual(reused_count, 1)
+		self.assertEqual(written_data, data)
+
+	def test_same_crc_and_size(self):
+		previous_data = forgeCrc(b"textures/foo/bar\n{\n}\n" * 64, 0x12345678)
+		data = forgeCrc(b"textures/foo/baz\n{\n}\n" * 64, 0x12345678)
+
+		self.assertEqual(zlib.crc32(previous_data), zlib.crc32(data))
+		self.assertEqual(len(previous_data), len(data))
+		self.assertNotEqual(previous_data, data)
+
+		reused_count, written_data = self.repackage(previous_data, data)
+
+		self.assertEqual(reused_count, 0)
+		self.assertEqual(written_data, data)
+
+
+if __name__ == "__main__":
+	unittest.main()
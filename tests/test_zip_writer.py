@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+#-*- coding: UTF-8 -*-
+
+### Legal
+#
+# Author:  Thomas DEBESSE <dev@illwieckz.net>
+# License: ISC
+#
+
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Urcheon import Zip
+
+
+class TestWriter(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_entry_path_separator(self):
+		with mock.patch.object(os, "sep", "\\"):
+			entry = Zip.Entry("scripts\\foo.shader", (1980, 1, 1, 0, 0, 0), 0)
+
+		self.assertEqual(entry.file_path, "scripts/foo.shader")
+
+	def test_multi_writer_threads(self):
+		# Files are compressed by the MultiWriter threads,
+		# wrapped writers don't start their own.
+		pak_list = [os.path.join(self.temp_dir.name, pak_name) for pak_name in ["foo.dpk", "foo.pk3"]]
+		writer_list = [Zip.Writer(pak_file) for pak_file in pak_list]
+
+		multi_writer = Zip.MultiWriter(writer_list)
+		multi_writer.addBytes("about/foo.txt", b"foo\n" * 64, [(zlib.Z_BEST_COMPRESSION, None), None])
+		multi_writer.addBytes("about/bar.txt", b"bar\n" * 64, [None, (None, None)])
+		multi_writer.close()
+
+		for writer in writer_list:
+			self.assertEqual(writer.executor, None)
+
+		for pak_file, file_path in zip(pak_list, ["about/foo.txt", "about/bar.txt"]):
+			zip_file = zipfile.ZipFile(pak_file, "r")
+			self.assertEqual(zip_file.namelist(), [file_path])
+			zip_file.close()
+
+	def test_window_memory(self):
+		# Entries are written when the data they hold exceeds the
+		# memory window, whatever the thread count is.
+		pak_file = os.path.join(self.temp_dir.name, "foo.dpk")
+		data_list = [os.urandom(1000) for file_index in range(16)]
+
+		with mock.patch.object(Zip, "window_memory_size", 5000):
+			writer = Zip.Writer(pak_file, thread_count=8)
+
+			for file_index, data in enumerate(data_list):
+				writer.addBytes("about/foo" + str(file_index) + ".txt", data, level=zlib.Z_BEST_COMPRESSION)
+
+				self.assertLessEqual(writer.window_memory, 5000)
+				self.assertLessEqual(len(writer.future_queue), 2)
+
+			writer.close()
+
+		self.assertEqual(writer.window_memory, 0)
+
+		zip_file = zipfile.ZipFile(pak_file, "r")
+		for file_index, data in enumerate(data_list):
+			self.assertEqual(zip_file.read("about/foo" + str(file_index) + ".txt"), data)
+		zip_file.close()
+
+
+if __name__ == "__main__":
+	unittest.main()